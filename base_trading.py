@@ -0,0 +1,228 @@
+"""
+交易系统公共基类
+
+main.py (单时间框架) 与 main_multitimeframe.py (多时间框架) 共用的连接、
+账户、风控下单、交易循环与启动流程。子类只实现数据获取与信号生成。
+"""
+
+import abc
+import asyncio
+import signal
+import sys
+from typing import Any, Dict, Optional
+from ibkr_client import IBKRClient
+from risk_management import RiskManager
+from logger import logger
+
+
+class TradingSystemBase(abc.ABC):
+    """交易系统基类 - 子类实现 get_data() 与 generate_signal()"""
+    
+    # 日志中的系统名称 / 交易循环名称 / 无信号提示，子类覆盖
+    SYSTEM_NAME = "CLAWA IBKR MNQ trading system"
+    LOOP_NAME = "trading loop"
+    NO_SIGNAL_MSG = "No trading signal generated"
+    INIT_DONE_MSG = "System initialized successfully!"
+    # 临时账户净值，实际应从 IBKR 获取
+    DEFAULT_EQUITY = 10000.0
+    
+    def __init__(self, strategy):
+        self.ibkr_client = IBKRClient()
+        self.strategy = strategy
+        self.risk_manager = RiskManager()
+        self.running = False
+        self.current_position = 0
+        self._stop_event = None  # 停止信号置位后，交易循环的等待立即结束
+    
+    async def initialize(self) -> bool:
+        """
+        初始化系统
+        
+        Returns:
+            bool: 初始化是否成功
+        """
+        logger.info("Initializing %s...", self.SYSTEM_NAME)
+        
+        # 连接 IBKR
+        if not await self.ibkr_client.connect():
+            logger.error("Failed to connect to IBKR")
+            return False
+        
+        # 获取初始账户信息
+        await self.update_account_info()
+        
+        # 验证交易权限
+        if not self.risk_manager.should_trade():
+            logger.warning("Risk management rules prevent trading")
+            return False
+        
+        logger.info(self.INIT_DONE_MSG)
+        return True
+    
+    async def update_account_info(self):
+        """更新账户信息"""
+        try:
+            # 获取账户净值（简化版本，实际需要从 IBKR 获取）
+            account_summary = self.ibkr_client.ib.accountSummary()
+            # 这里需要实现具体的账户信息获取逻辑
+            equity = self.DEFAULT_EQUITY
+            daily_pnl = 0.0   # 临时值
+            
+            self.risk_manager.update_account_info(equity, daily_pnl)
+            logger.info("Account info updated - Equity: $%.2f", equity)
+        
+        except Exception as e:
+            logger.error("Failed to update account info: %s", e)
+    
+    @abc.abstractmethod
+    async def get_data(self) -> Any:
+        """获取策略所需的市场数据，失败返回 None"""
+    
+    @abc.abstractmethod
+    def generate_signal(self, data: Any, current_price: float) -> Optional[Dict]:
+        """根据市场数据生成交易信号，无信号返回 None"""
+    
+    def log_signal(self, signal: Dict):
+        """下单前的额外信号日志 (子类可选覆盖)"""
+    
+    async def analyze_and_trade(self):
+        """分析市场并执行交易"""
+        try:
+            # 获取市场数据
+            data = await self.get_data()
+            if data is None:
+                return
+            
+            # 获取实时价格
+            realtime_data = await self.ibkr_client.get_realtime_data()
+            if realtime_data is None:
+                return
+            
+            current_price = realtime_data['last']
+            
+            # 生成交易信号
+            signal = self.generate_signal(data, current_price)
+            if signal is None:
+                logger.debug(self.NO_SIGNAL_MSG)
+                return
+            
+            # 风险管理检查
+            if not self.risk_manager.should_trade():
+                logger.warning("Risk management prevents trading")
+                return
+            
+            # 计算持仓手数
+            position_size = self.risk_manager.calculate_position_size(
+                signal['entry_price'],
+                signal['stop_loss']
+            )
+            
+            if position_size <= 0:
+                logger.warning("Position size is zero or negative")
+                return
+            
+            # 验证订单
+            if not self.risk_manager.validate_order(position_size, self.current_position):
+                logger.warning("Order validation failed")
+                return
+            
+            # 执行交易
+            action = signal['action']
+            logger.info("Executing %s order - Size: %s, Price: %s", action, position_size, current_price)
+            self.log_signal(signal)
+            
+            # 下单（这里使用市价单，实际可以考虑限价单）
+            order_id = await self.ibkr_client.place_market_order(action, position_size)
+            if order_id:
+                logger.info("Order executed successfully - Order ID: %s", order_id)
+                # 更新当前持仓
+                if action == 'BUY':
+                    self.current_position += position_size
+                else:
+                    self.current_position -= position_size
+            else:
+                logger.error("Order execution failed")
+        
+        except Exception as e:
+            logger.error("Error in analyze_and_trade: %s", e)
+    
+    def request_stop(self, signum=None):
+        """停止信号回调: 唤醒交易循环并在本轮结束后退出"""
+        logger.info("Received signal %s, initiating graceful shutdown...", signum)
+        if self._stop_event is not None:
+            self._stop_event.set()
+    
+    async def start_trading_loop(self):
+        """启动交易循环"""
+        self.running = True
+        if self._stop_event is None:
+            self._stop_event = asyncio.Event()
+        logger.info("Starting %s...", self.LOOP_NAME)
+        
+        # 初始化期间已收到停止信号时不再进入循环
+        while self.running and not self._stop_event.is_set():
+            try:
+                await self.analyze_and_trade()
+                # 等待下一次分析（可以根据需要调整间隔），收到停止信号时立即结束
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), timeout=60)  # 每分钟检查一次
+                    break
+                except asyncio.TimeoutError:
+                    pass
+            
+            except KeyboardInterrupt:
+                logger.info("Received shutdown signal...")
+                break
+            except Exception as e:
+                logger.error("Error in trading loop: %s", e)
+                # 继续运行，不要中断整个系统
+        
+        await self.stop()
+    
+    async def stop(self):
+        """停止交易系统"""
+        if not self.running:
+            return
+        
+        logger.info("Stopping %s...", self.SYSTEM_NAME)
+        self.running = False
+        
+        # 关闭连接
+        await self.ibkr_client.disconnect()
+        
+        logger.info("Trading system stopped.")
+
+
+async def _run(trading_system: TradingSystemBase) -> bool:
+    """在同一个事件循环中安装信号处理器、初始化并运行交易循环"""
+    # 停止事件先于信号处理器创建，初始化期间收到的信号不会丢失
+    trading_system._stop_event = asyncio.Event()
+    # 设置信号处理器: SIGINT/SIGTERM 直接唤醒交易循环
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, trading_system.request_stop, sig)
+        except NotImplementedError:
+            # Windows 事件循环不支持 add_signal_handler
+            signal.signal(sig, lambda signum, frame: loop.call_soon_threadsafe(trading_system.request_stop, signum))
+    
+    # 初始化
+    if not await trading_system.initialize():
+        return False
+    # 开始交易循环
+    await trading_system.start_trading_loop()
+    return True
+
+
+def run_system(trading_system: TradingSystemBase):
+    """命令行入口: 初始化并运行交易循环"""
+    try:
+        if not asyncio.run(_run(trading_system)):
+            logger.error("Failed to initialize trading system")
+            sys.exit(1)
+    
+    except KeyboardInterrupt:
+        logger.info("Application interrupted by user")
+    except Exception as e:
+        logger.error("Application error: %s", e)
+        sys.exit(1)
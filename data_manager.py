@@ -8,14 +8,42 @@
 4. 提供统一的数据访问接口
 """
 
+import asyncio
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
 from config import Config
 from logger import logger
 
 
+# OHLC 以 float32 存储: MNQ 报价为 0.25 的整数倍，float32 可精确表示，
+# 数据量减半，策略扫描时读取的字节数也减半
+PRICE_DTYPES = {'open': 'float32', 'high': 'float32', 'low': 'float32', 'close': 'float32'}
+
+# 保留的1分钟K线数量 (2天)
+MAX_BARS = 2880
+
+# 高周期K线: (属性名, 聚合周期)，周期都整除一天，桶边界与自然日对齐
+_TIMEFRAMES = (('df_5min', '5min'), ('df_15min', '15min'),
+               ('df_1hr', '60min'), ('df_4hr', '240min'))
+
+# 未订阅时轮询1分钟K线的请求参数
+_POLL_BARS_REQUEST = dict(endDateTime='', durationStr='2 D', barSizeSetting='1 min',
+                          whatToShow='TRADES', useRTH=True, formatDate=1)
+
+# update() 无数据变化时的返回值
+_NO_CHANGE = frozenset()
+
+# 1分钟K线订阅请求参数 (keepUpToDate: 之后由 IBKR 推送新K线)
+_LIVE_BARS_REQUEST = dict(endDateTime='', durationStr='2 D', barSizeSetting='1 min',
+                          whatToShow='TRADES', useRTH=True, formatDate=1, keepUpToDate=True)
+
+# 推送K线暂存缓冲区的记录类型 (列式存取，不为每根K线创建字典)
+_BAR_DTYPE = np.dtype([('ts', 'i8'), ('open', 'f4'), ('high', 'f4'),
+                       ('low', 'f4'), ('close', 'f4'), ('volume', 'i8')])
+
+
 class DataManager:
     """实时数据管理器 V2.0 - 增量更新版"""
     
@@ -33,6 +61,17 @@ class DataManager:
         self.live_file = 'mnq_1min_live.csv'
         
         self._last_bar_time = None
+        
+        # keepUpToDate 订阅: IBKR 推送K线，收盘的K线先暂存，update() 时一次合并
+        self._live_bars = None
+        self._pending = np.empty(MAX_BARS, dtype=_BAR_DTYPE)  # 已收盘、尚未合并的K线
+        self._n_pending = 0
+        self._on_new_bar = None  # 新K线收盘时的通知回调
+        self._last_close = 0.0  # 最新价格，在数据更新/K线推送时写入
+        
+        # 各时间框架数据版本号: 内容变化时加一，调用方据此只刷新变化的时间框架
+        self.version = dict.fromkeys(('1min', '5min', '15min', '1hr', '4hr'), 0)
+        self.revision = 0  # 任一时间框架变化时加一，调用方一次比较即可判断是否有新数据
     
     def _to_naive_datetime(self, dt):
         """转换到无时区datetime"""
@@ -52,6 +91,10 @@ class DataManager:
             df.index = df.index.tz_localize(None)
         return df
     
+    def _to_float32(self, df: pd.DataFrame) -> pd.DataFrame:
+        """OHLC 列转为 float32"""
+        return df.astype({col: dtype for col, dtype in PRICE_DTYPES.items() if col in df.columns})
+    
     def _convert_bar(self, bar):
         """转换IBKR K线数据"""
         dt = self._to_naive_datetime(bar.date)
@@ -71,13 +114,50 @@ class DataManager:
         
         self._load_all_data()
         self._aggregate_all_timeframes()
+        self._log_bar_counts()
+    
+    async def initialize_async(self, ib, contract, on_new_bar: Callable = None):
+        """
+        异步初始化: 本地历史数据加载与 IBKR K线订阅请求并行
+        
+        本地 CSV 在线程中读取，同时向 IBKR 发出 keepUpToDate 订阅请求，
+        启动耗时取两者中较长的一个。各高周期K线由1分钟数据聚合，不单独请求。
+        
+        Args:
+            ib: IB 连接
+            contract: 合约
+            on_new_bar: 每根K线收盘时调用 (见 subscribe)
+        """
+        self.ib = ib
+        self.contract = contract
+        
+        results = await asyncio.gather(
+            asyncio.to_thread(self._load_all_data),
+            self._request_live_bars_async(),
+            return_exceptions=True
+        )
+        if isinstance(results[0], Exception):
+            logger.error("历史数据加载失败: %s", results[0])
+        
+        self._aggregate_all_timeframes()
+        
+        bars = results[1]
+        if isinstance(bars, Exception):
+            logger.error("K线订阅失败: %s", bars)
+        elif bars is not None:
+            self._attach_live_bars(bars, on_new_bar)
+            self.update()
         
-        logger.info(f"✅ DataManager初始化完成")
-        logger.info(f"   1min: {len(self.df_1min)} 根")
-        logger.info(f"   5min: {len(self.df_5min)} 根")
-        logger.info(f"   15min: {len(self.df_15min)} 根")
-        logger.info(f"   1hr: {len(self.df_1hr)} 根")
-        logger.info(f"   4hr: {len(self.df_4hr)} 根")
+        self._log_bar_counts()
+    
+    def _log_bar_counts(self):
+        """输出各时间框架K线数量"""
+        logger.info("✅ DataManager初始化完成")
+        logger.info("   1min: %d 根", len(self.df_1min))
+        logger.info("   5min: %d 根", len(self.df_5min))
+        logger.info("   15min: %d 根", len(self.df_15min))
+        logger.info("   1hr: %d 根", len(self.df_1hr))
+        logger.info("   4hr: %d 根", len(self.df_4hr))
     
     def _load_all_data(self):
         """加载所有数据"""
@@ -90,7 +170,7 @@ class DataManager:
             df_hist.set_index('date', inplace=True)
             df_hist = self._ensure_datetimeindex(df_hist)
             df_merged = df_hist
-            logger.info(f"✅ 历史数据: {len(df_hist)} 根")
+            logger.info("✅ 历史数据: %d 根", len(df_hist))
         
         if os.path.exists(self.live_file):
             df_live = pd.read_csv(self.live_file, parse_dates=['date'])
@@ -102,11 +182,13 @@ class DataManager:
                 df_merged = df_merged.sort_index()
             else:
                 df_merged = df_live
-            logger.info(f"✅ 实时数据: {len(df_live)} 根")
+            logger.info("✅ 实时数据: %d 根", len(df_live))
         
         if not df_merged.empty:
-            self.df_1min = df_merged.tail(2880)
+            self.df_1min = self._to_float32(df_merged.tail(MAX_BARS))
             self._last_bar_time = self.df_1min.index[-1]
+            if self._live_bars is None:
+                self._last_close = float(self.df_1min['close'].iat[-1])
             self._save_live_data()
     
     def _save_live_data(self):
@@ -114,19 +196,57 @@ class DataManager:
         import os
         try:
             self.df_1min.to_csv(self.live_file)
-            logger.debug(f"💾 保存: {len(self.df_1min)} 根")
+            logger.debug("💾 保存: %d 根", len(self.df_1min))
         except Exception as e:
-            logger.error(f"保存失败: {e}")
+            logger.error("保存失败: %s", e)
     
     def _aggregate_all_timeframes(self):
         """聚合所有时间框架"""
         if self.df_1min.empty:
             return
         
-        self.df_5min = self._resample(self.df_1min, '5min')
-        self.df_15min = self._resample(self.df_1min, '15min')
-        self.df_1hr = self._resample(self.df_1min, '60min')
-        self.df_4hr = self._resample(self.df_1min, '240min')
+        for attr, freq in _TIMEFRAMES:
+            setattr(self, attr, self._resample(self.df_1min, freq))
+        for tf in self.version:
+            self.version[tf] += 1
+        self.revision += 1
+    
+    def _update_timeframes(self, since) -> set:
+        """
+        增量聚合: 只重算包含新K线 (时间 >= since) 的桶，以及因1分钟数据
+        裁剪而可能不完整的最早一个桶；其余已收盘的高周期K线直接沿用
+        
+        Returns:
+            set: 内容发生变化的高周期时间框架 (版本号已加一)
+        """
+        df = self.df_1min
+        if df.empty:
+            return set()
+        
+        changed = set()
+        index = df.index
+        first = index[0]
+        for attr, freq in _TIMEFRAMES:
+            old = getattr(self, attr)
+            start = since.floor(freq)
+            head_end = first.floor(freq) + pd.Timedelta(freq)
+            if old.empty or start <= head_end:
+                new = self._resample(df, freq)
+            else:
+                new = pd.concat([
+                    self._resample(df.iloc[:index.searchsorted(head_end)], freq),
+                    old.iloc[old.index.searchsorted(head_end):old.index.searchsorted(start)],
+                    self._resample(df.iloc[index.searchsorted(start):], freq),
+                ])
+            
+            # 新K线未改变该周期的任何一根K线时 (如成交量为0的K线) 保留原对象和版本号
+            if new.equals(old):
+                continue
+            setattr(self, attr, new)
+            tf = attr[3:]
+            self.version[tf] += 1
+            changed.add(tf)
+        return changed
     
     def _resample(self, df: pd.DataFrame, freq: str) -> pd.DataFrame:
         """聚合K线"""
@@ -143,53 +263,199 @@ class DataManager:
         
         return resampled
     
-    def update(self) -> bool:
-        """更新数据 - 增量获取最新K线"""
+    def subscribe(self, on_new_bar: Callable = None) -> bool:
+        """
+        订阅1分钟K线推送 (keepUpToDate)
+        
+        订阅后 IBKR 只推送新K线，update() 不再每分钟重新下载两天的数据。
+        
+        Args:
+            on_new_bar: 每根K线收盘时调用 (无参数)，用于驱动事件式主循环
+            
+        Returns:
+            bool: 是否订阅成功
+        """
         if not self.ib or not self.ib.isConnected():
             return False
         
         try:
-            bars = self.ib.reqHistoricalData(
-                self.contract,
-                endDateTime='',
-                durationStr='2 D',
-                barSizeSetting='1 min',
-                whatToShow='TRADES',
-                useRTH=True,
-                formatDate=1
-            )
-            
-            if not bars:
-                return False
-            
-            df_new = pd.DataFrame([self._convert_bar(bar) for bar in bars])
-            df_new.set_index('date', inplace=True)
-            df_new = df_new[~df_new.index.duplicated(keep='last')]
-            df_new = df_new.sort_index()
-            
-            if self._last_bar_time is not None:
-                df_new = df_new[df_new.index > self._last_bar_time]
-            
-            if df_new.empty:
-                return False
+            bars = self.ib.reqHistoricalData(self.contract, **_LIVE_BARS_REQUEST)
+            self._attach_live_bars(bars, on_new_bar)
+            return True
             
+        except Exception as e:
+            logger.error("K线订阅失败: %s", e)
+            return False
+    
+    async def subscribe_async(self, on_new_bar: Callable = None) -> bool:
+        """subscribe 的异步版本 (在事件循环中重连后使用)"""
+        try:
+            bars = await self._request_live_bars_async()
+        except Exception as e:
+            logger.error("K线订阅失败: %s", e)
+            return False
+        if bars is None:
+            return False
+        self._attach_live_bars(bars, on_new_bar)
+        return True
+    
+    async def _request_live_bars_async(self):
+        """异步发出 keepUpToDate K线请求，未连接时返回 None"""
+        if not self.ib or not self.ib.isConnected():
+            return None
+        return await self.ib.reqHistoricalDataAsync(self.contract, **_LIVE_BARS_REQUEST)
+    
+    def _attach_live_bars(self, bars, on_new_bar: Callable = None):
+        """登记订阅返回的K线列表: 补齐已收盘K线并注册推送回调"""
+        # 补齐订阅前缺失的已收盘K线 (最后一根仍在形成中)
+        for bar in bars[:-1]:
+            self.update_from_bar(bar)
+        
+        bars.updateEvent += self._on_bar_update
+        self._live_bars = bars
+        if bars:
+            self._last_close = float(bars[-1].close)
+        self._on_new_bar = on_new_bar
+        logger.info("✅ 已订阅1分钟K线推送")
+    
+    def unsubscribe(self):
+        """取消K线推送订阅"""
+        if self._live_bars is None:
+            return
+        self._live_bars.updateEvent -= self._on_bar_update
+        try:
+            if self.ib and self.ib.isConnected():
+                self.ib.cancelHistoricalData(self._live_bars)
+        except Exception as e:
+            logger.error("取消K线订阅失败: %s", e)
+        self._live_bars = None
+    
+    def _on_bar_update(self, bars, has_new_bar: bool):
+        """K线推送回调: 记录最新价格；出现新K线时，上一根已收盘，暂存等待合并"""
+        if bars:
+            self._last_close = float(bars[-1].close)
+        if has_new_bar and len(bars) >= 2:
+            if self.update_from_bar(bars[-2]) and self._on_new_bar is not None:
+                self._on_new_bar()
+    
+    def update_from_bar(self, bar) -> bool:
+        """
+        暂存一根已收盘的1分钟K线，下次 update() 时合并
+        
+        Returns:
+            bool: 是否为新K线 (不晚于已有最新K线的忽略)
+        """
+        ts = pd.Timestamp(self._to_naive_datetime(bar.date)).value
+        if self._n_pending:
+            last = self._pending['ts'][self._n_pending - 1]
+        else:
+            last = self._last_bar_time.value if self._last_bar_time is not None else None
+        if last is not None and ts <= last:
+            return False
+        
+        # 缓冲区满时 (长时间未调用 update) 只保留较新的一半
+        if self._n_pending == MAX_BARS:
+            half = MAX_BARS // 2
+            self._pending[:half] = self._pending[half:]
+            self._n_pending = half
+        
+        self._pending[self._n_pending] = (ts, bar.open, bar.high, bar.low, bar.close, bar.volume)
+        self._n_pending += 1
+        return True
+    
+    def update(self) -> frozenset:
+        """
+        更新数据 - 增量获取最新K线 (已订阅时只合并推送来的K线)
+        
+        Returns:
+            frozenset: 数据发生变化的时间框架 (如 {'1min', '5min', '15min'})，
+            无变化时为空集合
+        """
+        if self._live_bars is not None:
+            if not self._n_pending:
+                return _NO_CHANGE
+            rec = self._pending[:self._n_pending]
+            df_new = pd.DataFrame(
+                {col: rec[col].copy() for col in ('open', 'high', 'low', 'close', 'volume')},
+                index=pd.DatetimeIndex(rec['ts'].astype('datetime64[ns]'), name='date'))
+            self._n_pending = 0
+            return self._merge_new(df_new)
+        
+        if not self.ib or not self.ib.isConnected():
+            return _NO_CHANGE
+        
+        try:
+            bars = self.ib.reqHistoricalData(self.contract, **_POLL_BARS_REQUEST)
+            return self._merge_polled(bars)
+        except Exception as e:
+            logger.error("数据更新失败: %s", e)
+            return _NO_CHANGE
+    
+    async def update_async(self) -> frozenset:
+        """
+        update() 的协程版本: 未订阅时用 reqHistoricalDataAsync 轮询，
+        在事件循环中调用时不阻塞循环
+        
+        Returns:
+            frozenset: 数据发生变化的时间框架，无变化时为空集合
+        """
+        if self._live_bars is not None:
+            return self.update()
+        
+        if not self.ib or not self.ib.isConnected():
+            return _NO_CHANGE
+        
+        try:
+            bars = await self.ib.reqHistoricalDataAsync(self.contract, **_POLL_BARS_REQUEST)
+            return self._merge_polled(bars)
+        except Exception as e:
+            logger.error("数据更新失败: %s", e)
+            return _NO_CHANGE
+    
+    def _merge_polled(self, bars) -> frozenset:
+        """合并轮询得到的K线中比已有数据新的部分"""
+        if not bars:
+            return _NO_CHANGE
+        
+        df_new = pd.DataFrame([self._convert_bar(bar) for bar in bars])
+        df_new.set_index('date', inplace=True)
+        df_new = self._to_float32(df_new)
+        df_new = df_new[~df_new.index.duplicated(keep='last')]
+        df_new = df_new.sort_index()
+        
+        if self._last_bar_time is not None:
+            df_new = df_new[df_new.index > self._last_bar_time]
+        
+        return self._merge_new(df_new)
+    
+    def _merge_new(self, df_new: pd.DataFrame) -> frozenset:
+        """合并新的1分钟K线并重新聚合各时间框架，返回变化的时间框架"""
+        if df_new.empty:
+            return _NO_CHANGE
+        
+        try:
             self.df_1min = pd.concat([self.df_1min, df_new])
             self.df_1min = self.df_1min[~self.df_1min.index.duplicated(keep='last')]
-            self.df_1min = self.df_1min.tail(2880)
+            self.df_1min = self.df_1min.tail(MAX_BARS)
             
             self._last_bar_time = self.df_1min.index[-1]
+            if self._live_bars is None:
+                self._last_close = float(self.df_1min['close'].iat[-1])
             self._save_live_data()
-            self._aggregate_all_timeframes()
+            self.version['1min'] += 1
+            self.revision += 1
+            changed = self._update_timeframes(df_new.index[0])
+            changed.add('1min')
             
-            logger.debug(f"📊 新增{len(df_new)}根K线 | 最新: {self._last_bar_time}")
-            return True
+            logger.debug("📊 新增%d根K线 | 最新: %s", len(df_new), self._last_bar_time)
+            return frozenset(changed)
             
         except Exception as e:
-            logger.error(f"数据更新失败: {e}")
-            return False
+            logger.error("数据更新失败: %s", e)
+            return _NO_CHANGE
     
-    def get_data(self, timeframe: str = '15min') -> pd.DataFrame:
-        """获取指定时间框架数据"""
+    def get_data(self, timeframe: str = '15min') -> Optional[pd.DataFrame]:
+        """获取指定时间框架数据 (未知时间框架返回 None)"""
         tf_map = {
             '1min': self.df_1min,
             '5min': self.df_5min,
@@ -197,13 +463,11 @@ class DataManager:
             '1hr': self.df_1hr,
             '4hr': self.df_4hr,
         }
-        return tf_map.get(timeframe, pd.DataFrame())
+        return tf_map.get(timeframe)
     
     def get_current_price(self) -> float:
-        """获取当前价格"""
-        if self.df_1min.empty:
-            return 0.0
-        return float(self.df_1min.iloc[-1]['close'])
+        """获取当前价格 (已订阅时为正在形成的K线收盘价，无数据时为 0)"""
+        return self._last_close
     
     def get_bar_count(self) -> Dict[str, int]:
         """获取各时间框架的K线数量"""
@@ -10,12 +10,16 @@ import asyncio
 from config import Config
 from logger import logger
 
+# 视为下单成功 (已被网关接受) 的订单状态
+_ACK_STATES = ('Submitted', 'Filled')
+
 class IBKRClient:
     """IBKR API 客户端"""
     
     def __init__(self):
         self.ib = None
         self.connected = False
+        self.contract = None  # 连接后解析一次的 MNQ 合约 (含 conId)
         
     async def connect(self) -> bool:
         """
@@ -36,21 +40,30 @@ class IBKRClient:
             )
             
             self.connected = True
-            logger.info(f"Connected to IBKR at {Config.IBKR_HOST}:{Config.IBKR_PORT}")
+            logger.info("Connected to IBKR at %s:%s", Config.IBKR_HOST, Config.IBKR_PORT)
+            
+            # 合约只解析一次，之后的数据请求和下单都复用带 conId 的合约
+            contract = self.create_mnq_contract()
+            if await self.ib.qualifyContractsAsync(contract) and contract.conId:
+                self.contract = contract
+            else:
+                logger.warning("Failed to qualify MNQ contract, using unresolved contract")
             return True
             
         except Exception as e:
-            logger.error(f"Failed to connect to IBKR: {e}")
+            logger.error("Failed to connect to IBKR: %s", e)
             self.connected = False
             return False
     
     def create_mnq_contract(self) -> Future:
         """
-        创建 MNQ 期货合约
+        创建 MNQ 期货合约 (连接时已解析过则直接返回已解析的合约)
         
         Returns:
             Future: MNQ 期货合约对象
         """
+        if self.contract is not None:
+            return self.contract
         contract = Future(
             symbol=Config.SYMBOL,
             lastTradeDateOrContractMonth=Config.CONTRACT_MONTH,
@@ -98,11 +111,11 @@ class IBKRClient:
                     'volume': bar.volume
                 })
                 
-            logger.info(f"Retrieved {len(data)} bars of historical data")
+            logger.info("Retrieved %d bars of historical data", len(data))
             return data
             
         except Exception as e:
-            logger.error(f"Failed to get historical data: {e}")
+            logger.error("Failed to get historical data: %s", e)
             return []
     
     async def get_realtime_data(self) -> Optional[Dict[str, Any]]:
@@ -138,7 +151,7 @@ class IBKRClient:
                 return None
                 
         except Exception as e:
-            logger.error(f"Failed to get realtime data: {e}")
+            logger.error("Failed to get realtime data: %s", e)
             return None
     
     async def place_market_order(self, action: str, quantity: int) -> Optional[str]:
@@ -161,20 +174,42 @@ class IBKRClient:
             order = MarketOrder(action, quantity)
             trade = self.ib.placeOrder(contract, order)
             
-            # 等待订单确认
-            for _ in range(50):
-                if trade.orderStatus.status in ['Submitted', 'Filled']:
-                    logger.info(f"Market order placed - Action: {action}, Quantity: {quantity}, Status: {trade.orderStatus.status}")
-                    return str(trade.order.orderId)
-                await asyncio.sleep(0.1)
-                
-            logger.warning("Market order placement timeout")
+            # 等待订单确认: 由 statusEvent 唤醒，不按 0.1 秒轮询 (最多 5 秒)
+            try:
+                acknowledged = await asyncio.wait_for(self._wait_acknowledged(trade), timeout=5)
+            except asyncio.TimeoutError:
+                logger.warning("Market order placement timeout")
+                return str(trade.order.orderId)
+            
+            if not acknowledged:
+                logger.error("Market order rejected - Action: %s, Quantity: %s, Status: %s",
+                             action, quantity, trade.orderStatus.status)
+                return None
+            
+            logger.info("Market order placed - Action: %s, Quantity: %s, Status: %s",
+                        action, quantity, trade.orderStatus.status)
             return str(trade.order.orderId)
             
         except Exception as e:
-            logger.error(f"Failed to place market order: {e}")
+            logger.error("Failed to place market order: %s", e)
             return None
     
+    @staticmethod
+    async def _wait_acknowledged(trade) -> bool:
+        """
+        等待订单状态变为已提交或已成交
+        
+        订单先进入终态 (Cancelled/ApiCancelled) 或被拒 (Inactive) 时不再等待。
+        
+        Returns:
+            bool: 订单是否已提交或已成交
+        """
+        while trade.orderStatus.status not in _ACK_STATES:
+            if trade.isDone() or trade.orderStatus.status == 'Inactive':
+                return False
+            await trade.statusEvent
+        return True
+    
     async def place_limit_order(self, action: str, quantity: int, price: float) -> Optional[str]:
         """
         下限价单
@@ -196,11 +231,11 @@ class IBKRClient:
             order = LimitOrder(action, quantity, price)
             trade = self.ib.placeOrder(contract, order)
             
-            logger.info(f"Limit order placed - Action: {action}, Quantity: {quantity}, Price: {price}")
+            logger.info("Limit order placed - Action: %s, Quantity: %s, Price: %s", action, quantity, price)
             return str(trade.order.orderId)
             
         except Exception as e:
-            logger.error(f"Failed to place limit order: {e}")
+            logger.error("Failed to place limit order: %s", e)
             return None
     
     async def disconnect(self):
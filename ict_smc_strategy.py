@@ -6,19 +6,47 @@ ICT/SMC 策略引擎模块
 
 import pandas as pd
 import numpy as np
+from collections import deque
 from typing import Dict, List, Optional, Tuple
 from config import Config
 from logger import logger
+from kernels import (as_price_array, fvg_scan, market_structure, largest_n, smallest_n,
+                     FVG_BULLISH)
+
+# 趋势代码 -> 名称，下标与 kernels.TREND_* 对应
+_TREND_NAMES = ('unknown', 'bullish', 'bearish', 'ranging')
+
+# 订单块 / FVG / 流动性缓冲区容量: 信号只用到近期结构，旧数据自动淘汰
+BUFFER_SIZE = 64
 
 class ICTSMCStrategy:
     """ICT/SMC 策略引擎"""
     
     def __init__(self):
-        self.order_blocks = []  # 订单块列表
-        self.fvgs = []          # 公平价值缺口列表
-        self.liquidity_levels = []  # 流动性水平列表
+        self.order_blocks = deque(maxlen=BUFFER_SIZE)  # 订单块 (近期)
+        self.fvgs = deque(maxlen=BUFFER_SIZE)          # 公平价值缺口 (近期)
+        self.liquidity_levels = deque(maxlen=BUFFER_SIZE)  # 流动性水平 (最新一次)
         self.market_structure = None  # 市场结构状态
         
+        # 增量 FVG 扫描进度: 已扫描到的K线位置及其时间戳
+        self._fvg_last_i = 0
+        self._fvg_last_ts = None
+        
+        # 增量模式返回的 FVG 列表及其列数组 (方向/起点/终点)，仅在有新 FVG 时重建
+        self._fvg_list = []
+        self._fvg_cols = self._fvg_columns(self._fvg_list)
+        
+    def reset(self):
+        """清空缓冲区与增量扫描状态"""
+        self.order_blocks.clear()
+        self.fvgs.clear()
+        self.liquidity_levels.clear()
+        self.market_structure = None
+        self._fvg_last_i = 0
+        self._fvg_last_ts = None
+        self._fvg_list = []
+        self._fvg_cols = self._fvg_columns(self._fvg_list)
+        
     def analyze_market_structure(self, data: pd.DataFrame) -> Dict[str, any]:
         """
         分析市场结构
@@ -32,37 +60,10 @@ class ICTSMCStrategy:
         if len(data) < 3:
             return {'trend': 'unknown', 'structure': 'insufficient_data'}
             
-        # 识别高点和低点
-        highs = data['high'].values
-        lows = data['low'].values
-        
-        # 检测市场结构转变 (BOS/CHoCH)
-        recent_high = highs[-1]
-        recent_low = lows[-1]
-        prev_high = highs[-2]
-        prev_low = lows[-2]
-        
-        # 判断趋势
-        if recent_high > prev_high and recent_low > prev_low:
-            trend = 'bullish'
-        elif recent_high < prev_high and recent_low < prev_low:
-            trend = 'bearish'
-        else:
-            trend = 'ranging'
-            
-        # 检测 Break of Structure (BOS)
-        bos_detected = False
-        if trend == 'bullish' and recent_high > max(highs[-5:-1]):
-            bos_detected = True
-        elif trend == 'bearish' and recent_low < min(lows[-5:-1]):
-            bos_detected = True
-            
-        # 检测 Change of Character (CHoCH)
-        choch_detected = False
-        if trend == 'bullish' and recent_low < prev_low:
-            choch_detected = True
-        elif trend == 'bearish' and recent_high > prev_high:
-            choch_detected = True
+        # 趋势与 BOS/CHoCH 在编译内核中单遍计算，只读取最后5根K线
+        trend_code, bos_detected, choch_detected, recent_high, recent_low = market_structure(
+            as_price_array(data['high']), as_price_array(data['low']))
+        trend = _TREND_NAMES[trend_code]
             
         return {
             'trend': trend,
@@ -72,60 +73,73 @@ class ICTSMCStrategy:
             'recent_low': recent_low
         }
     
-    def detect_fvg(self, data: pd.DataFrame) -> List[Dict[str, any]]:
+    def detect_fvg(self, data: pd.DataFrame, incremental: bool = False) -> List[Dict[str, any]]:
         """
         检测公平价值缺口 (Fair Value Gap)
         
+        增量模式下只扫描上次之后新增的K线，新结果追加到 self.fvgs，
+        返回缓冲区中的近期 FVG；数据不是上次序列的延续时自动全量重扫。
+        
         Args:
             data (pd.DataFrame): OHLCV 数据
+            incremental (bool): 是否增量扫描，默认全量扫描并返回完整列表
             
         Returns:
             List[Dict]: FVG 列表
         """
         fvgs = []
         sensitivity = Config.FVG_SENSITIVITY
+        n = len(data)
+        if n < 3:
+            return fvgs
         
-        for i in range(2, len(data)):
-            # 三根K线模式检测FVG
-            prev_candle = data.iloc[i-2]
-            middle_candle = data.iloc[i-1]
-            current_candle = data.iloc[i]
-            
-            # Bullish FVG: 当前K线低点 > 前一根K线高点
-            if current_candle['low'] > prev_candle['high']:
-                gap_size = current_candle['low'] - prev_candle['high']
-                avg_range = (prev_candle['high'] - prev_candle['low'] + 
-                           middle_candle['high'] - middle_candle['low'] + 
-                           current_candle['high'] - current_candle['low']) / 3
-                
-                # 根据敏感度过滤
-                if gap_size > avg_range * sensitivity:
-                    fvgs.append({
-                        'type': 'bullish',
-                        'start_price': prev_candle['high'],
-                        'end_price': current_candle['low'],
-                        'gap_size': gap_size,
-                        'timestamp': current_candle.name,
-                        'valid_until': None  # 需要后续逻辑确定有效期
-                    })
-            
-            # Bearish FVG: 当前K线高点 < 前一根K线低点  
-            elif current_candle['high'] < prev_candle['low']:
-                gap_size = prev_candle['low'] - current_candle['high']
-                avg_range = (prev_candle['high'] - prev_candle['low'] + 
-                           middle_candle['high'] - middle_candle['low'] + 
-                           current_candle['high'] - current_candle['low']) / 3
-                
-                if gap_size > avg_range * sensitivity:
-                    fvgs.append({
-                        'type': 'bearish',
-                        'start_price': current_candle['high'],
-                        'end_price': prev_candle['low'],
-                        'gap_size': gap_size,
-                        'timestamp': current_candle.name,
-                        'valid_until': None
-                    })
-                    
+        start = 2
+        if incremental:
+            last_i = self._fvg_last_i
+            if 0 < last_i < n and data.index[last_i] == self._fvg_last_ts:
+                start = last_i + 1
+            else:
+                self.fvgs.clear()
+                self._fvg_list = []
+        
+        # 三根K线模式检测FVG (编译内核单遍扫描)
+        h = as_price_array(data['high'])
+        l = as_price_array(data['low'])
+        idx, direction, gaps = fvg_scan(h, l, float(sensitivity), start)
+        
+        index = data.index
+        for i, d, gap_size in zip(idx.tolist(), direction.tolist(), gaps.tolist()):
+            if d == FVG_BULLISH:
+                fvgs.append({
+                    'type': 'bullish',
+                    'start_price': float(h[i - 2]),
+                    'end_price': float(l[i]),
+                    'gap_size': gap_size,
+                    'timestamp': index[i],
+                    'valid_until': None  # 需要后续逻辑确定有效期
+                })
+            else:
+                fvgs.append({
+                    'type': 'bearish',
+                    'start_price': float(h[i]),
+                    'end_price': float(l[i - 2]),
+                    'gap_size': gap_size,
+                    'timestamp': index[i],
+                    'valid_until': None
+                })
+        
+        self._fvg_last_i = n - 1
+        self._fvg_last_ts = index[n - 1]
+        
+        if incremental:
+            if fvgs or len(self._fvg_list) != len(self.fvgs):
+                self.fvgs.extend(fvgs)
+                self._fvg_list = list(self.fvgs)
+                self._fvg_cols = self._fvg_columns(self._fvg_list)
+            return self._fvg_list
+        
+        self._append_new(self.fvgs, fvgs)
+        self._fvg_list = []  # 缓冲区已变化，下次增量调用时重建
         return fvgs
     
     def identify_order_blocks(self, data: pd.DataFrame) -> List[Dict[str, any]]:
@@ -163,7 +177,8 @@ class ICTSMCStrategy:
                     'strength': abs(price_change) * volume_ratio,
                     'tested': False  # 是否已被价格测试
                 })
-                
+        
+        self._append_new(self.order_blocks, order_blocks)
         return order_blocks
     
     def identify_liquidity_levels(self, data: pd.DataFrame) -> List[Dict[str, any]]:
@@ -180,8 +195,8 @@ class ICTSMCStrategy:
         threshold = Config.LIQUIDITY_THRESHOLD
         
         # 识别近期高点和低点作为流动性池
-        recent_highs = data['high'].tail(20).nlargest(3)
-        recent_lows = data['low'].tail(20).nsmallest(3)
+        recent_highs = largest_n(data['high'].to_numpy()[-20:], 3)
+        recent_lows = smallest_n(data['low'].to_numpy()[-20:], 3)
         
         # 高点流动性（止损猎杀区域）
         for high in recent_highs:
@@ -198,9 +213,22 @@ class ICTSMCStrategy:
                 'price': low,
                 'strength': threshold
             })
-            
+        
+        # 流动性水平每次整体重算，缓冲区只保留最新一组
+        self.liquidity_levels.clear()
+        self.liquidity_levels.extend(liquidity_levels)
         return liquidity_levels
     
+    @staticmethod
+    def _append_new(buffer: deque, items: List[Dict]):
+        """把时间戳晚于缓冲区末尾的结果追加进缓冲区 (items 按时间升序)"""
+        if not items:
+            return
+        if buffer:
+            last_ts = buffer[-1]['timestamp']
+            items = [item for item in items if item['timestamp'] > last_ts]
+        buffer.extend(items)
+    
     def generate_trading_signal(self, data: pd.DataFrame, current_price: float) -> Optional[Dict[str, any]]:
         """
         生成交易信号
@@ -218,8 +246,8 @@ class ICTSMCStrategy:
             if market_analysis['trend'] == 'unknown':
                 return None
                 
-            # 2. 检测 FVG
-            fvgs = self.detect_fvg(data)
+            # 2. 检测 FVG (只扫描新增K线)
+            fvgs = self.detect_fvg(data, incremental=True)
             
             # 3. 识别订单块
             order_blocks = self.identify_order_blocks(data)
@@ -254,10 +282,12 @@ class ICTSMCStrategy:
         if market_analysis['trend'] not in ['bullish', 'bearish']:
             return None
             
-        # 条件2: 存在有效的FVG
-        valid_fvgs = [fvg for fvg in fvgs if self._is_fvg_valid(fvg, current_price)]
-        if not valid_fvgs:
+        # 条件2: 存在有效的FVG (列数组上一次性判断)
+        cols = self._fvg_cols if fvgs is self._fvg_list else self._fvg_columns(fvgs)
+        valid_idx = np.flatnonzero(self._fvg_valid_mask(cols, current_price))
+        if not len(valid_idx):
             return None
+        valid_fvgs = [fvgs[i] for i in valid_idx]
             
         # 条件3: 接近订单块区域
         near_order_block = self._is_near_order_block(order_blocks, current_price)
@@ -304,6 +334,23 @@ class ICTSMCStrategy:
         else:
             return current_price <= fvg['end_price'] and current_price >= fvg['start_price'] - 10
     
+    @staticmethod
+    def _fvg_columns(fvgs: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """FVG 列表转为 (方向 int8: 1 多 / -1 空, 起点价, 终点价) 列数组"""
+        types = np.array([1 if fvg['type'] == 'bullish' else -1 for fvg in fvgs], dtype=np.int8)
+        start = np.array([fvg['start_price'] for fvg in fvgs], dtype=np.float64)
+        end = np.array([fvg['end_price'] for fvg in fvgs], dtype=np.float64)
+        return types, start, end
+    
+    @staticmethod
+    def _fvg_valid_mask(cols: Tuple[np.ndarray, np.ndarray, np.ndarray],
+                        current_price: float) -> np.ndarray:
+        """向量化的 _is_fvg_valid: 返回每个 FVG 是否有效"""
+        types, start, end = cols
+        bull = (types == 1) & (start <= current_price) & (current_price <= end + 10)
+        bear = (types != 1) & (current_price <= end) & (current_price >= start - 10)
+        return bull | bear
+    
     def _is_near_order_block(self, order_blocks: List[Dict], current_price: float) -> bool:
         """检查是否接近订单块"""
         for block in order_blocks:
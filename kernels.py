@@ -0,0 +1,423 @@
+"""
+数值计算内核
+
+策略热路径中的纯数值循环。安装了 numba 时使用 @njit 编译为机器码，
+未安装时退化为普通 Python 函数，计算结果一致；FVG 扫描在未安装时
+改用 NumPy 向量化实现。
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:  # numba 为可选依赖
+    HAVE_NUMBA = False
+    def njit(*args, **kwargs):
+        """numba 不可用时的空装饰器"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+
+def as_price_array(series):
+    """
+    取价格列的 ndarray: float32/float64 列零拷贝直接返回，其他类型转为 float64
+
+    Args:
+        series (pd.Series): 价格列
+
+    Returns:
+        np.ndarray: 浮点价格数组
+    """
+    arr = series.to_numpy()
+    return arr if arr.dtype.kind == 'f' else arr.astype(np.float64)
+
+
+def largest_n(values, n):
+    """
+    取最大的 n 个值 (降序)，等价于 Series.nlargest(n) 的取值
+
+    用 np.partition 做 O(len) 选择，只对选出的 n 个值排序。
+
+    Args:
+        values (np.ndarray): 数值数组
+        n (int): 个数
+
+    Returns:
+        np.ndarray: 降序排列的最大 n 个值 (不足 n 个时全部返回)
+    """
+    if values.shape[0] > n:
+        values = np.partition(values, -n)[-n:]
+    return np.sort(values)[::-1]
+
+
+def smallest_n(values, n):
+    """
+    取最小的 n 个值 (升序)，等价于 Series.nsmallest(n) 的取值
+
+    Args:
+        values (np.ndarray): 数值数组
+        n (int): 个数
+
+    Returns:
+        np.ndarray: 升序排列的最小 n 个值 (不足 n 个时全部返回)
+    """
+    if values.shape[0] > n:
+        values = np.partition(values, n - 1)[:n]
+    return np.sort(values)
+
+
+# manage_trade_series 的平仓原因代码
+EXIT_NONE = 0
+EXIT_TAKE_PROFIT = 1
+EXIT_STOP_LOSS = 2
+EXIT_SESSION_END = 3
+
+# 只开启不改变 NaN/Inf 语义的 fastmath 选项: 允许倒数近似、FMA 合并与重结合，
+# 但保留 nnan/ninf，行情中的 NaN 价格仍按 IEEE 规则比较 (不会误触发平仓)
+SAFE_FASTMATH = {'arcp', 'contract', 'reassoc'}
+
+
+@njit(cache=True, fastmath=SAFE_FASTMATH)
+def manage_trade_series(prices, entry, stop, tp, is_buy, session_mask):
+    """
+    逐价格回放单笔交易，返回第一个平仓事件
+
+    判断顺序与 SessionTradingStrategy.manage_active_trade 一致:
+    止盈 -> 止损 -> 时段结束。风险距离的倒数在循环外计算一次，
+    循环内的 R 倍数只做乘法。
+
+    Args:
+        prices (np.ndarray): 价格序列 (float64)
+        entry (float): 入场价
+        stop (float): 止损价
+        tp (float): 止盈价
+        is_buy (bool): 是否多头
+        session_mask (np.ndarray): 每个价格是否处于交易时段 (bool)
+
+    Returns:
+        Tuple[int, int, float, float]: (平仓索引, 平仓原因代码, 盈亏点数, R 倍数)，
+            未平仓时索引为 -1
+    """
+    risk = abs(entry - stop)
+    inv_risk = 1.0 / risk if risk > 0 else 0.0
+
+    n = prices.shape[0]
+    for i in range(n):
+        p = prices[i]
+        pnl = p - entry if is_buy else entry - p
+
+        if is_buy:
+            if p >= tp:
+                return i, EXIT_TAKE_PROFIT, pnl, pnl * inv_risk
+            if p <= stop:
+                return i, EXIT_STOP_LOSS, pnl, pnl * inv_risk
+        else:
+            if p <= tp:
+                return i, EXIT_TAKE_PROFIT, pnl, pnl * inv_risk
+            if p >= stop:
+                return i, EXIT_STOP_LOSS, pnl, pnl * inv_risk
+
+        if not session_mask[i]:
+            return i, EXIT_SESSION_END, pnl, pnl * inv_risk
+
+    return -1, EXIT_NONE, 0.0, 0.0
+
+
+# fvg_scan 返回的 FVG 方向代码
+FVG_BULLISH = 1
+FVG_BEARISH = -1
+
+
+@njit(cache=True, fastmath=SAFE_FASTMATH)
+def _fvg_scan_loop(h: np.ndarray, l: np.ndarray, sens: float,
+                   start: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    三根K线 FVG 单遍扫描
+
+    对每个 i >= start 比较 i-2 与 i 两根K线，缺口需大于三根K线平均振幅 * sens。
+    结果写入预分配数组后按实际数量截断返回，按K线顺序排列。
+
+    Args:
+        h (np.ndarray): 最高价序列 (float64)
+        l (np.ndarray): 最低价序列 (float64)
+        sens (float): 缺口敏感度
+        start (int): 起始K线索引 (不小于 2)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: (当前K线索引, 方向代码, 缺口大小)
+    """
+    n = h.shape[0]
+    if start < 2:
+        start = 2
+    size = n - start if n > start else 0
+    idx = np.empty(size, dtype=np.int64)
+    direction = np.empty(size, dtype=np.int8)
+    gap = np.empty(size, dtype=np.float64)
+
+    k = 0
+    for i in range(start, n):
+        avg_range = (h[i - 2] - l[i - 2] + h[i - 1] - l[i - 1] + h[i] - l[i]) / 3.0
+        if l[i] > h[i - 2]:
+            g = l[i] - h[i - 2]
+            if g > avg_range * sens:
+                idx[k] = i
+                direction[k] = FVG_BULLISH
+                gap[k] = g
+                k += 1
+        elif h[i] < l[i - 2]:
+            g = l[i - 2] - h[i]
+            if g > avg_range * sens:
+                idx[k] = i
+                direction[k] = FVG_BEARISH
+                gap[k] = g
+                k += 1
+
+    return idx[:k], direction[:k], gap[:k]
+
+
+def _fvg_scan_numpy(h: np.ndarray, l: np.ndarray, sens: float,
+                    start: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    fvg_scan 的 NumPy 向量化实现 (numba 不可用时使用)
+
+    用错位切片一次算出所有三根K线组合的缺口与平均振幅，再由布尔掩码取出命中位置。
+    平均振幅先升为 float64 再除以 3，与编译循环的数值结果一致。
+    """
+    n = h.shape[0]
+    if start < 2:
+        start = 2
+    if n <= start:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8), np.empty(0, dtype=np.float64)
+
+    ph, pl = h[start - 2:n - 2], l[start - 2:n - 2]  # 前一根K线
+    mh, ml = h[start - 1:n - 1], l[start - 1:n - 1]  # 中间K线
+    ch, cl = h[start:], l[start:]                    # 当前K线
+
+    avg_range = (ph - pl + mh - ml + ch - cl).astype(np.float64) / 3.0
+    bull_gap = cl - ph
+    bear_gap = pl - ch
+    up = cl > ph
+    bull = up & (bull_gap > avg_range * sens)
+    bear = ~up & (ch < pl) & (bear_gap > avg_range * sens)
+
+    hit = np.flatnonzero(bull | bear)
+    is_bull = bull[hit]
+    idx = (hit + start).astype(np.int64)
+    direction = np.where(is_bull, FVG_BULLISH, FVG_BEARISH).astype(np.int8)
+    gap = np.where(is_bull, bull_gap[hit], bear_gap[hit]).astype(np.float64)
+    return idx, direction, gap
+
+
+# 有 numba 时用编译后的单遍循环，否则用向量化实现
+fvg_scan = _fvg_scan_loop if HAVE_NUMBA else _fvg_scan_numpy
+
+
+@njit(cache=True, fastmath=SAFE_FASTMATH)
+def recent_fvg_flags(h, l, k, sens):
+    """
+    最近 k 根K线内是否出现多头/空头 FVG
+
+    只需要方向标志时替代完整的 FVG 列表: 不分配输出数组，
+    多空两个方向都出现后立即返回。判定条件与 fvg_scan 一致。
+
+    Args:
+        h (np.ndarray): 最高价序列
+        l (np.ndarray): 最低价序列
+        k (int): 回看K线数
+        sens (float): 缺口敏感度
+
+    Returns:
+        Tuple[bool, bool]: (存在多头FVG, 存在空头FVG)
+    """
+    n = h.shape[0]
+    bull = False
+    bear = False
+    start = n - k
+    if start < 2:
+        start = 2
+    for i in range(start, n):
+        avg_range = (h[i - 2] - l[i - 2] + h[i - 1] - l[i - 1] + h[i] - l[i]) / 3.0
+        if l[i] > h[i - 2]:
+            if l[i] - h[i - 2] > avg_range * sens:
+                bull = True
+        elif h[i] < l[i - 2]:
+            if l[i - 2] - h[i] > avg_range * sens:
+                bear = True
+        if bull and bear:
+            break
+    return bull, bear
+
+
+# 趋势代码 (mtf_analyze 返回值)
+TREND_UNKNOWN = 0
+TREND_BULLISH = 1
+TREND_BEARISH = 2
+TREND_RANGING = 3
+
+# 趋势查找表，下标为 [高点方向 + 1, 低点方向 + 1]: 高低点同升为多头、同降为空头，其余为震荡
+TREND_TABLE = np.full((3, 3), TREND_RANGING, dtype=np.int8)
+TREND_TABLE[2, 2] = TREND_BULLISH
+TREND_TABLE[0, 0] = TREND_BEARISH
+
+
+@njit(cache=True)
+def trend_code(h, l):
+    """
+    根据最近两根K线的高低点判断趋势，不足5根K线为 TREND_UNKNOWN
+
+    Args:
+        h (np.ndarray): 最高价序列 (float64)
+        l (np.ndarray): 最低价序列 (float64)
+
+    Returns:
+        int: 趋势代码
+    """
+    n = h.shape[0]
+    if n < 5:
+        return TREND_UNKNOWN
+    # 高/低点变化方向取 -1/0/1 (NaN 比较为假，记为 0)，再查表得到趋势
+    dh = int(h[n - 1] > h[n - 2]) - int(h[n - 1] < h[n - 2])
+    dl = int(l[n - 1] > l[n - 2]) - int(l[n - 1] < l[n - 2])
+    return TREND_TABLE[dh + 1, dl + 1]
+
+
+@njit(cache=True)
+def mtf_analyze(h4, l4, h1, l1, h15, l15, sens, lookback):
+    """
+    多时间框架分析融合内核
+
+    一次调用完成三个时间框架的趋势判断、15分钟近期 FVG 方向检测与
+    近20根K线流动性高低点计算，中间不产生临时数组。
+    FVG 扫描在多空两个方向都已出现后提前结束。
+
+    Args:
+        h4, l4 (np.ndarray): 4小时最高/最低价 (可为空数组)
+        h1, l1 (np.ndarray): 1小时最高/最低价 (可为空数组)
+        h15, l15 (np.ndarray): 15分钟最高/最低价 (至少1根K线)
+        sens (float): FVG 敏感度
+        lookback (int): FVG 回看K线数，为 0 时不检测 FVG (调用方已有 fvg_scan
+            结果，两个标志均为 False)
+
+    Returns:
+        Tuple[int, int, int, bool, bool, float, float]:
+            (4小时趋势, 1小时趋势, 15分钟趋势, 存在多头FVG, 存在空头FVG,
+             流动性高点, 流动性低点)
+    """
+    t4 = trend_code(h4, l4)
+    t1 = trend_code(h1, l1)
+    t15 = trend_code(h15, l15)
+
+    fvg_bull, fvg_bear = recent_fvg_flags(h15, l15, lookback, sens)
+
+    n = h15.shape[0]
+    w = n - 20 if n > 20 else 0
+    hi_liq = h15[w]
+    lo_liq = l15[w]
+    for i in range(w + 1, n):
+        if h15[i] > hi_liq:
+            hi_liq = h15[i]
+        if l15[i] < lo_liq:
+            lo_liq = l15[i]
+
+    return t4, t1, t15, fvg_bull, fvg_bear, hi_liq, lo_liq
+
+
+@njit(cache=True)
+def market_structure(h, l):
+    """
+    单遍计算市场结构: 趋势、BOS、CHoCH
+
+    只读取最后5根K线，前4根的最高/最低点与最近两根K线的高低点在同一个循环中取得。
+
+    Args:
+        h (np.ndarray): 最高价序列 (至少2根K线)
+        l (np.ndarray): 最低价序列
+
+    Returns:
+        Tuple[int, bool, bool, float, float]:
+            (趋势代码, BOS, CHoCH, 最近高点, 最近低点)，趋势代码不含 TREND_UNKNOWN
+    """
+    n = h.shape[0]
+    start = n - 5 if n > 5 else 0
+    prior_high = h[start]
+    prior_low = l[start]
+    for i in range(start + 1, n - 1):
+        if h[i] > prior_high:
+            prior_high = h[i]
+        if l[i] < prior_low:
+            prior_low = l[i]
+
+    rh = h[n - 1]
+    rl = l[n - 1]
+    ph = h[n - 2]
+    pl = l[n - 2]
+    dh = int(rh > ph) - int(rh < ph)
+    dl = int(rl > pl) - int(rl < pl)
+    trend = TREND_TABLE[dh + 1, dl + 1]
+
+    bos = False
+    choch = False
+    if trend == TREND_BULLISH:
+        bos = rh > prior_high
+        choch = rl < pl
+    elif trend == TREND_BEARISH:
+        bos = rl < prior_low
+        choch = rh > ph
+
+    return trend, bos, choch, rh, rl
+
+
+@njit(cache=True)
+def position_size(capital, entry, stop, risk_frac, multiplier, max_position):
+    """
+    按固定风险比例计算开仓手数
+
+    Args:
+        capital (float): 账户资金
+        entry (float): 入场价
+        stop (float): 止损价
+        risk_frac (float): 单笔风险占资金的比例
+        multiplier (float): 合约乘数 (每点价值)
+        max_position (int): 最大手数
+
+    Returns:
+        int: 手数；资金不为正时为 0，止损距离为 0 时为 1
+    """
+    if capital <= 0:
+        return 0
+    diff = entry - stop
+    risk_per_contract = (diff if diff >= 0 else -diff) * multiplier
+    if risk_per_contract <= 0:
+        return 1
+    size = int((capital * risk_frac) // risk_per_contract)
+    return size if size < max_position else max_position
+
+
+def warmup():
+    """
+    预先编译实盘会用到的内核特化版本
+
+    价格数组可能是 float32 (DataManager 存储) 或 float64 (空时间框架占位)，
+    对两种类型及其组合各调用一次。配合 cache=True，首次运行编译并写入缓存，
+    之后的进程直接加载；未安装 numba 时不做任何事。
+    """
+    if not HAVE_NUMBA:
+        return
+
+    arrays = []
+    for dtype in (np.float32, np.float64):
+        h = np.linspace(100.0, 130.0, 30).astype(dtype)
+        arrays.append((h, h - 1))
+
+    for h, l in arrays:
+        fvg_scan(h, l, 1.0, 0)
+        market_structure(h, l)
+    for h4, l4 in arrays:
+        for h1, l1 in arrays:
+            for h15, l15 in arrays:
+                mtf_analyze(h4, l4, h1, l1, h15, l15, 1.0, 0)
+    position_size(100000.0, 20000.0, 19990.0, 0.01, 2.0, 10)
@@ -2,20 +2,32 @@
 日志配置模块
 
 设置应用程序的日志格式、级别和输出目标。
+记录器只挂一个 QueueHandler，真正的 I/O 由 QueueListener 后台线程完成，
+IBKR 回调等热路径上的日志调用只做一次入队，不会阻塞事件循环。
 """
 
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 from config import Config
 
+# 后台写日志的监听线程 (重复 setup_logger 时先停掉旧的)
+_listener = None
+
 def setup_logger():
     """设置并返回应用日志记录器"""
+    global _listener
     
     # 创建日志记录器
     logger = logging.getLogger('clawa_ibkr_mnq')
     logger.setLevel(getattr(logging, Config.LOG_LEVEL.upper()))
     
     # 避免重复处理器
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
     if logger.handlers:
         logger.handlers.clear()
     
@@ -30,10 +42,24 @@ def setup_logger():
     )
     console_handler.setFormatter(formatter)
     
-    # 添加处理器到记录器
-    logger.addHandler(console_handler)
+    # 记录器只入队，控制台输出交给后台线程
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(
+        log_queue, console_handler, respect_handler_level=True
+    )
+    _listener.start()
     
     return logger
 
+
+def _stop_listener():
+    """退出时停止监听线程，确保队列中剩余日志全部写出"""
+    if _listener is not None:
+        _listener.stop()
+
+
+atexit.register(_stop_listener)
+
 # 全局日志记录器实例
 logger = setup_logger()
\ No newline at end of file
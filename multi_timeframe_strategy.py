@@ -9,6 +9,7 @@ import numpy as np
 from typing import Dict, List, Optional, Tuple
 from config import Config
 from logger import logger
+from kernels import largest_n, smallest_n
 
 class MultiTimeframeStrategy:
     """多时间框架策略引擎"""
@@ -128,8 +129,8 @@ class MultiTimeframeStrategy:
     def _identify_support_resistance(self, data: pd.DataFrame) -> Dict[str, List[float]]:
         """识别支撑阻力位"""
         # 简化的支撑阻力识别
-        recent_highs = data['high'].tail(20).nlargest(3).tolist()
-        recent_lows = data['low'].tail(20).nsmallest(3).tolist()
+        recent_highs = largest_n(data['high'].to_numpy()[-20:], 3).tolist()
+        recent_lows = smallest_n(data['low'].to_numpy()[-20:], 3).tolist()
         
         return {
             'support': recent_lows,
@@ -215,39 +216,40 @@ class MultiTimeframeStrategy:
         fvgs = []
         sensitivity = self._get_fvg_sensitivity(timeframe)
         
-        for i in range(2, len(data)):
-            prev_candle = data.iloc[i-2]
-            middle_candle = data.iloc[i-1]
-            current_candle = data.iloc[i]
-            
+        # 高低点一次取成列表，三根K线用错位 zip 遍历，避免逐行构造 Series
+        highs = data['high'].to_numpy().tolist()
+        lows = data['low'].to_numpy().tolist()
+        bars = zip(highs, lows, highs[1:], lows[1:], highs[2:], lows[2:])
+        
+        for prev_high, prev_low, mid_high, mid_low, curr_high, curr_low in bars:
             # Bullish FVG
-            if current_candle['low'] > prev_candle['high']:
-                gap_size = current_candle['low'] - prev_candle['high']
-                avg_range = (prev_candle['high'] - prev_candle['low'] + 
-                           middle_candle['high'] - middle_candle['low'] + 
-                           current_candle['high'] - current_candle['low']) / 3
+            if curr_low > prev_high:
+                gap_size = curr_low - prev_high
+                avg_range = (prev_high - prev_low + 
+                           mid_high - mid_low + 
+                           curr_high - curr_low) / 3
                 
                 if gap_size > avg_range * sensitivity:
                     fvgs.append({
                         'type': 'bullish',
-                        'start_price': prev_candle['high'],
-                        'end_price': current_candle['low'],
+                        'start_price': prev_high,
+                        'end_price': curr_low,
                         'gap_size': gap_size,
                         'timeframe': timeframe
                     })
             
             # Bearish FVG  
-            elif current_candle['high'] < prev_candle['low']:
-                gap_size = prev_candle['low'] - current_candle['high']
-                avg_range = (prev_candle['high'] - prev_candle['low'] + 
-                           middle_candle['high'] - middle_candle['low'] + 
-                           current_candle['high'] - current_candle['low']) / 3
+            elif curr_high < prev_low:
+                gap_size = prev_low - curr_high
+                avg_range = (prev_high - prev_low + 
+                           mid_high - mid_low + 
+                           curr_high - curr_low) / 3
                 
                 if gap_size > avg_range * sensitivity:
                     fvgs.append({
                         'type': 'bearish',
-                        'start_price': current_candle['high'],
-                        'end_price': prev_candle['low'],
+                        'start_price': curr_high,
+                        'end_price': prev_low,
                         'gap_size': gap_size,
                         'timeframe': timeframe
                     })
@@ -303,8 +305,8 @@ class MultiTimeframeStrategy:
     def _detect_liquidity(self, data: pd.DataFrame, timeframe: str) -> Dict[str, List[float]]:
         """检测流动性水平"""
         # 高时间框架的流动性更重要
-        recent_highs = data['high'].tail(20).nlargest(3).tolist()
-        recent_lows = data['low'].tail(20).nsmallest(3).tolist()
+        recent_highs = largest_n(data['high'].to_numpy()[-20:], 3).tolist()
+        recent_lows = smallest_n(data['low'].to_numpy()[-20:], 3).tolist()
         
         return {
             'sell_side_liquidity': recent_highs,  # 止损猎杀区域（上方）
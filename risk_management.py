@@ -17,6 +17,11 @@ class RiskManager:
         self.position_size = 0
         self.max_position_size = Config.MAX_POSITION_SIZE
         
+        # 配置在运行期间不变，百分比预先换算成比例
+        self._risk_frac = Config.RISK_PERCENTAGE / 100.0
+        self._daily_loss_frac = Config.DAILY_LOSS_LIMIT / 100.0
+        self._min_equity = 1000.0  # 最小账户要求
+        
     def update_account_info(self, equity: float, daily_pnl: float):
         """
         更新账户信息
@@ -44,7 +49,7 @@ class RiskManager:
             return 0
             
         # 计算单笔风险金额
-        risk_amount = self.account_equity * (Config.RISK_PERCENTAGE / 100)
+        risk_amount = self.account_equity * self._risk_frac
         
         # 计算每手风险
         risk_per_contract = abs(entry_price - stop_loss) * 2  # MNQ 合约乘数为 2
@@ -73,13 +78,14 @@ class RiskManager:
             bool: True 表示可以交易，False 表示暂停交易
         """
         # 检查日亏损限制
-        if self.daily_loss >= (self.account_equity * (Config.DAILY_LOSS_LIMIT / 100)):
+        daily_loss_limit = self.account_equity * self._daily_loss_frac
+        if self.daily_loss >= daily_loss_limit:
             logger.warning(f"Daily loss limit reached: ${self.daily_loss:.2f} / "
-                          f"${self.account_equity * (Config.DAILY_LOSS_LIMIT / 100):.2f}")
+                          f"${daily_loss_limit:.2f}")
             return False
             
         # 检查账户净值是否足够
-        if self.account_equity < 1000:  # 最小账户要求
+        if self.account_equity < self._min_equity:
             logger.warning("Account equity too low for trading")
             return False
             
@@ -11,11 +11,58 @@
 
 import pandas as pd
 import numpy as np
+from collections import namedtuple
 from datetime import datetime, time, timezone
 import pytz
 from typing import Dict, Optional, Tuple
 from config import Config
 from logger import logger
+from kernels import (manage_trade_series, EXIT_TAKE_PROFIT, EXIT_STOP_LOSS,
+                     EXIT_SESSION_END)
+
+# 每个 tick 只从 DataFrame 提取一次的最新行情快照
+MarketSnapshot = namedtuple('MarketSnapshot', 'close high low volume close_prev')
+
+# 回放内核平仓原因代码 -> manage_active_trade 的 reason 文本
+_EXIT_REASONS = {
+    EXIT_TAKE_PROFIT: 'Take profit reached',
+    EXIT_STOP_LOSS: 'Stop loss hit',
+    EXIT_SESSION_END: 'Session ended',
+}
+
+
+def make_snapshot(data: pd.DataFrame) -> MarketSnapshot:
+    """
+    从市场数据中提取最新行情快照
+
+    Args:
+        data (pd.DataFrame): 市场数据 (至少两根K线)
+
+    Returns:
+        MarketSnapshot: 最新收盘/最高/最低/成交量及前一根收盘价
+    """
+    tail = data[['close', 'high', 'low', 'volume']].tail(2).to_numpy()
+    return MarketSnapshot(tail[-1, 0], tail[-1, 1], tail[-1, 2], tail[-1, 3], tail[-2, 0])
+
+
+def window_view(data: pd.DataFrame, end_time, length: int) -> pd.DataFrame:
+    """
+    截取截至 end_time（含）的最近 length 根K线
+    
+    用 searchsorted 在有序时间索引上定位，再做 iloc 切片，
+    避免 data[data.index <= ts] 这类布尔过滤每个 tick 整表拷贝。
+    
+    Args:
+        data (pd.DataFrame): 按时间排序的市场数据
+        end_time: 窗口结束时间
+        length (int): 窗口长度
+        
+    Returns:
+        pd.DataFrame: 窗口切片
+    """
+    end = data.index.searchsorted(end_time, side='right')
+    return data.iloc[max(0, end - length):end]
+
 
 class SessionTradingStrategy:
     """会话交易策略引擎"""
@@ -48,6 +95,8 @@ class SessionTradingStrategy:
             'min_points': 50,      # 最小50点盈利
             'risk_reward_ratio': 2.0  # 2R 风险回报比
         }
+        self._min_points = self.profit_targets['min_points']
+        self._rr_target = self.profit_targets['risk_reward_ratio']
         
     def is_trading_session(self, current_time: datetime) -> Optional[str]:
         """
@@ -94,7 +143,10 @@ class SessionTradingStrategy:
             return {'should_trade': False, 'reason': f'Already traded in {session_name}'}
             
         # 分析市场条件
-        signal = self._analyze_market_conditions(market_data, session_name)
+        if len(market_data) < 10:
+            return {'should_trade': False, 'reason': 'No valid signal'}
+        snap = make_snapshot(market_data)
+        signal = self._analyze_market_conditions(market_data, snap, session_name)
         if not signal['valid']:
             return {'should_trade': False, 'reason': 'No valid signal'}
             
@@ -109,7 +161,7 @@ class SessionTradingStrategy:
         risk_reward = profit_points / risk_points if risk_points > 0 else 0
         
         # 必须满足 2R 或 50点盈利
-        if profit_points < self.profit_targets['min_points'] and risk_reward < self.profit_targets['risk_reward_ratio']:
+        if profit_points < self._min_points and risk_reward < self._rr_target:
             return {'should_trade': False, 'reason': 'Profit target not met (need 2R or 50 points)'}
             
         return {
@@ -144,12 +196,14 @@ class SessionTradingStrategy:
         # 为了简化，我们假设每次运行都是新的
         return False
     
-    def _analyze_market_conditions(self, data: pd.DataFrame, session_name: str) -> Dict[str, any]:
+    def _analyze_market_conditions(self, data: pd.DataFrame, snap: MarketSnapshot,
+                                   session_name: str) -> Dict[str, any]:
         """
         分析市场条件生成交易信号
         
         Args:
             data (pd.DataFrame): 市场数据
+            snap (MarketSnapshot): 最新行情快照
             session_name (str): 交易时段名称
             
         Returns:
@@ -157,44 +211,42 @@ class SessionTradingStrategy:
         """
         if len(data) < 10:
             return {'valid': False, 'reason': 'Insufficient data'}
-            
-        # 获取最新价格
-        current_price = data['close'].iloc[-1]
-        high = data['high'].iloc[-1]
-        low = data['low'].iloc[-1]
-        volume = data['volume'].iloc[-1]
         
         # 简化的 ICT/SMC 信号检测
-        signal = self._detect_ict_smc_signal(data, session_name)
+        signal = self._detect_ict_smc_signal(data, snap, session_name)
         if not signal['valid']:
             return signal
             
         # 根据交易时段调整信号
-        adjusted_signal = self._adjust_signal_for_session(signal, session_name, current_price)
+        adjusted_signal = self._adjust_signal_for_session(signal, session_name, snap.close)
         return adjusted_signal
     
-    def _detect_ict_smc_signal(self, data: pd.DataFrame, session_name: str) -> Dict[str, any]:
+    def _detect_ict_smc_signal(self, data: pd.DataFrame, snap: MarketSnapshot,
+                               session_name: str) -> Dict[str, any]:
         """
         检测 ICT/SMC 信号
         
         Args:
             data (pd.DataFrame): 市场数据
+            snap (MarketSnapshot): 最新行情快照
             session_name (str): 交易时段名称
             
         Returns:
             Dict: 信号结果
         """
         # 简化实现：基于价格行为的基本信号
-        recent_highs = data['high'].tail(20).nlargest(3)
-        recent_lows = data['low'].tail(20).nsmallest(3)
+        # 一次性取出近20根K线的高低点数组，阻力/支撑即窗口内的最高/最低价
+        window = data[['high', 'low']].tail(20).to_numpy()
+        resistance = window[:, 0].max()
+        support = window[:, 1].min()
         
-        current_price = data['close'].iloc[-1]
-        prev_close = data['close'].iloc[-2]
+        current_price = snap.close
+        prev_close = snap.close_prev
         
         # 检测突破信号
-        if current_price > recent_highs.iloc[0] and current_price > prev_close:
+        if current_price > resistance and current_price > prev_close:
             # 突破阻力，看涨信号
-            stop_loss = recent_lows.iloc[0]  # 最近支撑位作为止损
+            stop_loss = support  # 最近支撑位作为止损
             entry_price = current_price
             confidence = 0.7
             
@@ -205,9 +257,9 @@ class SessionTradingStrategy:
                 'stop_loss': stop_loss,
                 'confidence': confidence
             }
-        elif current_price < recent_lows.iloc[0] and current_price < prev_close:
+        elif current_price < support and current_price < prev_close:
             # 突破支撑，看跌信号
-            stop_loss = recent_highs.iloc[0]  # 最近阻力位作为止损
+            stop_loss = resistance  # 最近阻力位作为止损
             entry_price = current_price
             confidence = 0.7
             
@@ -262,7 +314,7 @@ class SessionTradingStrategy:
         risk_points = abs(entry_price - stop_loss)
         
         # 2R 目标
-        rr_target = entry_price + (entry_price - stop_loss) * self.profit_targets['risk_reward_ratio']
+        rr_target = entry_price + (entry_price - stop_loss) * self._rr_target
         
         # 50点目标
         points_target = entry_price + 50 if entry_price > stop_loss else entry_price - 50
@@ -313,6 +365,69 @@ class SessionTradingStrategy:
             
         # 继续持仓
         return {'action': 'HOLD', 'reason': 'Trade still active'}
+    
+    def _session_mask(self, times: pd.DatetimeIndex) -> np.ndarray:
+        """
+        批量计算每个时间点是否处于交易时段
+        
+        Args:
+            times (pd.DatetimeIndex): 时间序列（无时区信息时按 UTC 处理）
+            
+        Returns:
+            np.ndarray: 布尔数组
+        """
+        times = pd.DatetimeIndex(times)
+        if times.tz is None:
+            times = times.tz_localize(timezone.utc)
+        else:
+            times = times.tz_convert(timezone.utc)
+        
+        seconds = (times.hour * 3600 + times.minute * 60 + times.second).to_numpy(dtype=np.float64)
+        seconds += times.microsecond.to_numpy() / 1e6
+        
+        mask = np.zeros(len(times), dtype=np.bool_)
+        for session_info in self.trading_sessions.values():
+            start, end = session_info['start_time'], session_info['end_time']
+            start_s = start.hour * 3600 + start.minute * 60 + start.second
+            end_s = end.hour * 3600 + end.minute * 60 + end.second
+            mask |= (seconds >= start_s) & (seconds <= end_s)
+        return mask
+    
+    def replay_active_trade(self, trade_info: Dict, prices, times) -> Dict[str, any]:
+        """
+        在历史价格序列上回放交易管理（批量版 manage_active_trade）
+        
+        Args:
+            trade_info (Dict): 交易信息
+            prices: 开仓后的价格序列
+            times: 与价格对应的时间序列
+            
+        Returns:
+            Dict: 交易管理决策，平仓时附带 rr/index/time
+        """
+        prices = np.ascontiguousarray(prices, dtype=np.float64)
+        session_mask = self._session_mask(times)
+        
+        idx, code, pnl_points, rr = manage_trade_series(
+            prices,
+            float(trade_info['entry_price']),
+            float(trade_info['stop_loss']),
+            float(trade_info['take_profit']),
+            trade_info['action'] == 'BUY',
+            session_mask
+        )
+        
+        if idx < 0:
+            return {'action': 'HOLD', 'reason': 'Trade still active'}
+        
+        return {
+            'action': 'CLOSE',
+            'reason': _EXIT_REASONS[code],
+            'pnl_points': pnl_points,
+            'rr': rr,
+            'index': idx,
+            'time': pd.DatetimeIndex(times)[idx]
+        }
 
 # 使用示例
 if __name__ == "__main__":
@@ -328,10 +443,10 @@ if __name__ == "__main__":
         'low': [24980, 25030, 25080],
         'close': [25050, 25100, 25120],
         'volume': [1000, 1200, 1100]
-    })
+    }, index=pd.date_range('2026-02-08 02:00', periods=3, freq='15min', tz='UTC'))
     
-    # 检查是否应该交易
-    trade_decision = strategy.should_enter_trade(test_time, market_data)
+    # 检查是否应该交易（只取截至当前时间的最近20根K线）
+    trade_decision = strategy.should_enter_trade(test_time, window_view(market_data, test_time, 20))
     print(f"Trade decision: {trade_decision}")
     
     # 如果有活跃交易，管理它
@@ -10,163 +10,493 @@ ICT/SMC V2.0 交易策略 (多时间框架版)
 
 import pandas as pd
 import numpy as np
+from bisect import bisect_right
+from enum import IntEnum
+from concurrent.futures import Executor, ProcessPoolExecutor
 from datetime import datetime, time
 from typing import Dict, List, Optional, Tuple
 from config import Config
 from logger import logger
+from kernels import (as_price_array, fvg_scan, mtf_analyze, position_size, FVG_BULLISH,
+                     TREND_UNKNOWN, TREND_BULLISH, TREND_BEARISH, TREND_RANGING)
+
+
+# 趋势代码 -> 名称，下标与 kernels.TREND_* 对应
+_TREND_NAMES = ('unknown', 'bullish', 'bearish', 'ranging')
+
+
+class Trend(IntEnum):
+    """趋势 (整数比较；str() 得到对外的名称)"""
+    UNKNOWN = TREND_UNKNOWN
+    BULLISH = TREND_BULLISH
+    BEARISH = TREND_BEARISH
+    RANGING = TREND_RANGING
+    
+    def __str__(self) -> str:
+        return _TREND_NAMES[self]
+
+# 交易时段小时集合 (CST 7:00-20:00)
+_SESSION_HOURS = frozenset(range(7, 20))
+# 同一时段的24位小时掩码: 第 h 位为 1 表示 h 点在交易时段内
+_SESSION_MASK = sum(1 << h for h in _SESSION_HOURS)
+
+# 4小时 / 1小时趋势对对齐评分的贡献，按趋势代码索引
+_TREND_SCORE_4H = (0, 2, -2, 0)
+_TREND_SCORE_1H = (0, 2, -2, 1)
+
+# 多时间框架分析结果的默认值
+_MTF_DEFAULTS = {
+    'trend_4hr': 'unknown',
+    'trend_1hr': 'unknown',
+    'trend_15min': 'unknown',
+    'fvg_bullish': False,
+    'fvg_bearish': False,
+    'fvgs': (),
+    'liquidity_high': 0,
+    'liquidity_low': 0,
+    'alignment_score': 0,
+    'direction': None
+}
+
+# 默认移动止损级别 (RR 级别, 动作, 移动止损 R)
+_TRAIL_LEVELS = (
+    (1.5, 'partial', 0.5),
+    (2.0, 'trail', 1.0),
+    (3.0, 'trail', 2.0),
+    (4.0, 'close', 3.0),
+)
+
+# MNQ 合约乘数 (每点 $2)
+_MNQ_MULTIPLIER = 2.0
+
+# 缺失时间框架的占位数组
+_EMPTY_OHLC = {'high': np.empty(0), 'low': np.empty(0)}
+
+
+def _mtf_trend(h4: np.ndarray, l4: np.ndarray, h1: np.ndarray, l1: np.ndarray,
+               h15: np.ndarray, l15: np.ndarray, sens: float,
+               fvg_bullish: bool, fvg_bearish: bool
+               ) -> Tuple[int, int, int, float, float, int, Optional[str]]:
+    """
+    多时间框架趋势、流动性与对齐评分
+    
+    make_signal_fn 与 ICTSMCV2Strategy.analyze_mtf_alignment 共用，
+    两条路径的趋势判断和评分规则只在这里定义。
+    
+    Returns:
+        Tuple: (4小时趋势, 1小时趋势, 15分钟趋势 (趋势代码), 流动性高点,
+            流动性低点, 对齐评分, 方向 'BUY'/'SELL'/None)
+    """
+    # FVG 方向由调用方给出，内核不再重复扫描 (lookback=0)
+    t4, t1, t15, _, _, high_liq, low_liq = mtf_analyze(h4, l4, h1, l1, h15, l15, sens, 0)
+    
+    score = _TREND_SCORE_4H[t4] + _TREND_SCORE_1H[t1]
+    direction = None
+    
+    # 15分钟趋势需有同向 FVG 才给出方向
+    if t15 == TREND_BULLISH and fvg_bullish:
+        score += 3
+        direction = 'BUY'
+    elif t15 == TREND_BEARISH and fvg_bearish:
+        score -= 3
+        direction = 'SELL'
+    
+    return t4, t1, t15, float(high_liq), float(low_liq), score, direction
+
+
+def make_signal_fn(cfg=Config):
+    """
+    生成特化的信号计算函数
+    
+    FVG 敏感度及各项阈值在创建时固化为闭包常量，返回的函数直接接收
+    各时间框架的高/低价数组，每个 tick 不再做字典查找和属性访问。
+    返回的函数不修改策略状态 (冷却时间等由调用方维护)。
+    
+    Args:
+        cfg: 配置对象，默认 Config
+        
+    Returns:
+        Callable: _gen(h4, l4, h1, l1, h15, l15, current_price, key=None) -> Optional[Dict]
+            传入 key (各时间框架最新K线的标识) 时，与价格无关的分析部分
+            在 key 不变期间只计算一次
+    """
+    sens = float(cfg.FVG_SENSITIVITY)
+    fvg_lookback = 10
+    fvg_zone = 10          # FVG 区域外延点数
+    stop_buffer = 5        # 止损放在流动性外侧的点数
+    max_risk = 100         # 最大风险距离
+    tp_rr = 4              # 止盈 R 倍数
+    names = _TREND_NAMES
+    
+    # 与价格无关的分析结果按K线缓存: [键, 结果]
+    cache = [None, None]
+    
+    def _analyze(h4, l4, h1, l1, h15, l15):
+        """趋势/评分/FVG 区域/流动性，无方向时返回 None"""
+        # FVG 只扫描一次: 方向标志与入场区域共用同一份结果
+        idx, fvg_dir, _ = fvg_scan(h15, l15, sens, len(h15) - fvg_lookback)
+        fvg_bull = bool((fvg_dir == FVG_BULLISH).any())
+        fvg_bear = bool((fvg_dir != FVG_BULLISH).any())
+        t4, t1, t15, high_liq, low_liq, score, direction = _mtf_trend(
+            h4, l4, h1, l1, h15, l15, sens, fvg_bull, fvg_bear)
+        if direction is None:
+            return None
+        
+        # 名称只用于输出的信号字典
+        trend_4hr = names[t4]
+        trend_1hr = names[t1]
+        trend_15min = names[t15]
+        is_buy = direction == 'BUY'
+        
+        confidence = 0.5
+        if score >= 5:
+            confidence = 0.85
+        elif score >= 3:
+            confidence = 0.7
+        
+        if trend_4hr == direction.lower():
+            confidence += 0.1
+        
+        # 最近3个FVG中同向者的价格区域 (下沿数组, 上沿数组)，每根K线只构建一次
+        idx3 = idx[-3:]
+        same_dir = (fvg_dir[-3:] == FVG_BULLISH) if is_buy else (fvg_dir[-3:] != FVG_BULLISH)
+        idx3 = idx3[same_dir]
+        if is_buy:
+            zones = (h15[idx3 - 2].astype(np.float64), l15[idx3].astype(np.float64) + fvg_zone)
+        else:
+            zones = (h15[idx3].astype(np.float64) - fvg_zone, l15[idx3 - 2].astype(np.float64))
+        
+        return (direction, is_buy, score, confidence, zones,
+                trend_4hr, trend_1hr, trend_15min, high_liq, low_liq)
+    
+    def _gen(h4, l4, h1, l1, h15, l15, current_price, key=None):
+        if key is None or key != cache[0]:
+            analysis = _analyze(h4, l4, h1, l1, h15, l15)
+            if key is not None:
+                cache[0] = key
+                cache[1] = analysis
+        else:
+            analysis = cache[1]
+        
+        if analysis is None:
+            return None
+        (direction, is_buy, score, confidence, zones,
+         trend_4hr, trend_1hr, trend_15min, high_liq, low_liq) = analysis
+        
+        # 价格位于同向 FVG 区域内加分 (只加一次)
+        zone_lo, zone_hi = zones
+        if ((zone_lo <= current_price) & (current_price <= zone_hi)).any():
+            confidence += 0.15
+        
+        if is_buy:
+            if high_liq <= current_price:
+                return None
+            risk_distance = current_price - low_liq + stop_buffer
+            stop_loss = low_liq - stop_buffer
+            take_profit = current_price + risk_distance * tp_rr
+        else:
+            if low_liq >= current_price:
+                return None
+            risk_distance = high_liq + stop_buffer - current_price
+            stop_loss = high_liq + stop_buffer
+            take_profit = current_price - risk_distance * tp_rr
+        
+        if risk_distance <= 0 or risk_distance > max_risk:
+            return None
+        
+        return {
+            'action': direction,
+            'entry_price': current_price,
+            'stop_loss': stop_loss,
+            'risk_distance': risk_distance,
+            'take_profit': take_profit,
+            'confidence': min(confidence, 1.0),
+            'trend_4hr': trend_4hr,
+            'trend_1hr': trend_1hr,
+            'trend_15min': trend_15min,
+            'alignment_score': score
+        }
+    
+    return _gen
+
+
+class ActiveTrade:
+    """持仓交易状态 (__slots__ 属性访问，update_trade 每个 tick 读写)"""
+    
+    __slots__ = ('action', 'sign', 'exit_action', 'entry_price', 'stop_loss', 'take_profit',
+                 'risk_distance', 'size', 'trail_level', 'partial_filled',
+                 'partial_size', 'pnl', 'open_time')
+    
+    action: str
+    sign: int
+    exit_action: str
+    entry_price: float
+    stop_loss: float
+    take_profit: float
+    risk_distance: float
+    size: int
+    trail_level: float
+    partial_filled: bool
+    partial_size: int
+    pnl: float
+    open_time: Optional[datetime]
+    
+    def __init__(self, action: str, entry_price: float, stop_loss: float,
+                 take_profit: float, risk_distance: float, size: int,
+                 open_time: datetime = None):
+        self.action = action
+        self.sign = 1 if action == 'BUY' else -1  # 多头 1 / 空头 -1
+        self.exit_action = 'SELL' if action == 'BUY' else 'BUY'  # 平仓方向
+        self.entry_price = entry_price
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.risk_distance = risk_distance
+        self.size = size
+        self.trail_level = 0
+        self.partial_filled = False
+        self.partial_size = 0
+        self.pnl = 0.0
+        self.open_time = open_time
+    
+    def to_dict(self) -> Dict:
+        """转为字典 (对外接口与日志使用)"""
+        return {name: getattr(self, name) for name in self.__slots__}
 
 
 class ICTSMCV2Strategy:
     """ICT/SMC V2.0 交易策略"""
     
-    def __init__(self):
+    def __init__(self, trail_levels=None):
+        """
+        Args:
+            trail_levels: 移动止损级别 [(RR 级别, 动作, 移动止损 R), ...]，
+                顺序不限，默认 _TRAIL_LEVELS
+        """
         self.active_trade = None
+        self._in_trade = False  # 持仓标志，热循环中可直接判断，跳过 generate_signal
         self.last_signal_time = None
         self.last_fvg_time = None
         
-        self.TRAIL_LEVELS = {
-            1.5: {'action': 'partial', 'trail_stop': 0.5},
-            2.0: {'action': 'trail', 'trail_stop': 1.0},
-            3.0: {'action': 'trail', 'trail_stop': 2.0},
-            4.0: {'action': 'close', 'trail_stop': 3.0}
-        }
+        # detect_fvg 结果缓存: 同一根K线上 MTF 分析与信号生成共用一次计算
+        self._fvg_cache = {}
+        self._fvg_cache_size = 64
+        self._fvg_all_key = None  # detect_fvg_all 的全历史结果缓存 (数据帧 id, 长度)
+        self._fvg_all = None
+        
+        # 移动止损级别只在初始化时排序一次
+        self._trail_levels_sorted: Tuple[Tuple[float, str, float], ...] = tuple(sorted(
+            tuple(item) for item in (trail_levels if trail_levels is not None else _TRAIL_LEVELS)))
+        self._trail_thresholds: Tuple[float, ...] = tuple(level for level, _, _ in self._trail_levels_sorted)
+        
+        # 多时间框架分析结果，每次分析原地更新
+        self._mtf_result = dict(_MTF_DEFAULTS)
+        self._mtf_key = None  # 上次分析时各时间框架的K线标识
+        
+        # 特化的信号计算函数，每个 tick 的唯一计算入口
+        self._fast_signal = make_signal_fn()
+        
+        # generate_signals_batch 的进程池，首次使用时创建
+        self._pool = None
     
     def is_trading_session(self, dt) -> Optional[str]:
         """检查是否在交易时段 (CST = UTC-6)"""
-        hour = dt.hour
-        if hour >= 7 and hour < 20:
-            return 'extended'
-        return None
+        return 'extended' if (_SESSION_MASK >> dt.hour) & 1 else None
+    
+    @staticmethod
+    def _to_ohlc(df: pd.DataFrame) -> Dict:
+        """
+        DataFrame 转为 OHLC 数组字典
+        
+        每个时间框架每个 tick 只转换一次，之后趋势/FVG/流动性计算都直接读数组。
+        'key' 用于 FVG 缓存: 对象 id + 长度 + 最新K线时间/高低点，
+        原地改写最后一根K线也会失效。
+        """
+        n = len(df)
+        ohlc = {
+            'open': as_price_array(df['open']),
+            'high': as_price_array(df['high']),
+            'low': as_price_array(df['low']),
+            'close': as_price_array(df['close']),
+            'index': df.index,
+            'n': n,
+        }
+        ohlc['key'] = (id(df), n, df.index[-1], ohlc['high'][-1], ohlc['low'][-1]) if n else None
+        return ohlc
     
-    def get_trend(self, data: pd.DataFrame) -> str:
-        """判断趋势 - 简化版"""
+    def get_trend(self, data: pd.DataFrame) -> Trend:
+        """判断趋势 - 简化版 (返回 Trend，需要名称时 str())"""
         if len(data) < 5:
-            return 'unknown'
+            return Trend.UNKNOWN
         
-        highs = data['high'].values
-        lows = data['low'].values
-        
-        recent_high = highs[-1]
-        recent_low = lows[-1]
-        prev_high = highs[-2]
-        prev_low = lows[-2]
+        # 只读取最后两根K线的标量，不取整列数组
+        highs: pd.Series = data['high']
+        lows: pd.Series = data['low']
+        recent_high: float = highs.iat[-1]
+        recent_low: float = lows.iat[-1]
+        prev_high: float = highs.iat[-2]
+        prev_low: float = lows.iat[-2]
         
         if recent_high > prev_high and recent_low > prev_low:
-            return 'bullish'
+            return Trend.BULLISH
         elif recent_high < prev_high and recent_low < prev_low:
-            return 'bearish'
+            return Trend.BEARISH
         else:
-            return 'ranging'
+            return Trend.RANGING
     
     def detect_fvg(self, data: pd.DataFrame, lookback: int = 10) -> List[Dict]:
-        """检测FVG - 只返回近期有效的"""
-        fvgs = []
+        """检测FVG - 只返回近期有效的 (按数据帧与最新K线缓存)"""
         if len(data) < 3:
-            return fvgs
-        
+            return []
+        return self._fvg(self._to_ohlc(data), lookback)
+    
+    def _fvg(self, ohlc: Dict, lookback: int = 10) -> List[Dict]:
+        """基于 OHLC 数组检测FVG (带缓存)"""
+        if ohlc['n'] < 3:
+            return []
+        
+        key = ohlc['key'] + (lookback,)
+        fvgs = self._fvg_cache.get(key)
+        if fvgs is None:
+            if len(self._fvg_cache) >= self._fvg_cache_size:
+                self._fvg_cache.clear()
+            fvgs = self._fvg_cache[key] = self._detect_fvg(ohlc, lookback)
+        return fvgs
+    
+    def _detect_fvg(self, ohlc: Dict, lookback: int) -> List[Dict]:
+        """FVG 扫描 (不经缓存)"""
+        fvgs = []
         sensitivity = Config.FVG_SENSITIVITY
         
-        for i in range(max(2, len(data) - lookback), len(data)):
-            prev = data.iloc[i-2]
-            middle = data.iloc[i-1]
-            curr = data.iloc[i]
-            
-            if curr['low'] > prev['high']:
-                gap = curr['low'] - prev['high']
-                avg_range = (prev['high'] - prev['low'] + 
-                           middle['high'] - middle['low'] +
-                           curr['high'] - curr['low']) / 3
-                if gap > avg_range * sensitivity:
-                    fvgs.append({
-                        'type': 'bullish',
-                        'low': prev['high'],
-                        'high': curr['low'],
-                        'gap': gap,
-                        'index': i,
-                        'time': data.index[i]
-                    })
-            
-            elif curr['high'] < prev['low']:
-                gap = prev['low'] - curr['high']
-                avg_range = (prev['high'] - prev['low'] + 
-                           middle['high'] - middle['low'] +
-                           curr['high'] - curr['low']) / 3
-                if gap > avg_range * sensitivity:
-                    fvgs.append({
-                        'type': 'bearish',
-                        'low': curr['high'],
-                        'high': prev['low'],
-                        'gap': gap,
-                        'index': i,
-                        'time': data.index[i]
-                    })
+        h = ohlc['high']
+        l = ohlc['low']
+        idx, direction, gaps = fvg_scan(h, l, float(sensitivity), ohlc['n'] - lookback)
+        
+        index = ohlc['index']
+        for i, d, gap in zip(idx.tolist(), direction.tolist(), gaps.tolist()):
+            if d == FVG_BULLISH:
+                fvgs.append({
+                    'type': 'bullish',
+                    'low': float(h[i - 2]),
+                    'high': float(l[i]),
+                    'gap': gap,
+                    'index': i,
+                    'time': index[i]
+                })
+            else:
+                fvgs.append({
+                    'type': 'bearish',
+                    'low': float(h[i]),
+                    'high': float(l[i - 2]),
+                    'gap': gap,
+                    'index': i,
+                    'time': index[i]
+                })
         
         return fvgs
     
+    def detect_fvg_all(self, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        一次性检测整段历史的全部FVG (回测用)
+        
+        回测中对逐渐增长的切片反复调用 detect_fvg 是 O(N²)；这里对完整数据
+        只扫描一次，之后第 k 根K线处的结果即 ``result.loc[k - lookback + 1:k]``
+        (序号不小于 2 的部分)，与 detect_fvg(data.iloc[:k + 1], lookback) 一致。
+        
+        Args:
+            data: 完整的 OHLC 数据
+        
+        Returns:
+            按K线序号索引的 DataFrame，列为 type / low / high / gap / time
+        """
+        key = (id(data), len(data))
+        if key == self._fvg_all_key:
+            return self._fvg_all
+        
+        h = as_price_array(data['high'])
+        l = as_price_array(data['low'])
+        idx, direction, gaps = fvg_scan(h, l, float(Config.FVG_SENSITIVITY), 0)
+        
+        is_bull = direction == FVG_BULLISH
+        fvgs = pd.DataFrame({
+            'type': np.where(is_bull, 'bullish', 'bearish'),
+            'low': np.where(is_bull, h[idx - 2], h[idx]).astype(np.float64),
+            'high': np.where(is_bull, l[idx], l[idx - 2]).astype(np.float64),
+            'gap': gaps,
+            'time': data.index[idx],
+        }, index=pd.Index(idx, name='index'))
+        
+        self._fvg_all_key = key
+        self._fvg_all = fvgs
+        return fvgs
+    
     def get_liquidity(self, data: pd.DataFrame) -> Tuple[float, float]:
         """获取流动性水平"""
-        recent_highs = data['high'].tail(20).nlargest(3)
-        recent_lows = data['low'].tail(20).nsmallest(3)
-        return float(recent_highs.max()), float(recent_lows.min())
+        return self._liquidity(data['high'].to_numpy(), data['low'].to_numpy())
+    
+    @staticmethod
+    def _liquidity(h: np.ndarray, l: np.ndarray) -> Tuple[float, float]:
+        """近20根K线的流动性高低点"""
+        # 前3高点的最大值即窗口最大值，无需排序
+        return float(h[-20:].max()), float(l[-20:].min())
     
     def analyze_mtf_alignment(self, data: Dict[str, pd.DataFrame]) -> Dict:
-        """多时间框架对齐分析"""
-        result = {
-            'trend_4hr': 'unknown',
-            'trend_1hr': 'unknown',
-            'trend_15min': 'unknown',
-            'fvg_bullish': False,
-            'fvg_bearish': False,
-            'liquidity_high': 0,
-            'liquidity_low': 0,
-            'alignment_score': 0,
-            'direction': None
-        }
-        
-        if not data or not data.get('15min') or data['15min'].empty:
+        """多时间框架对齐分析 (返回的字典在下次分析时会被覆盖)"""
+        df_15min = data.get('15min') if data else None
+        if df_15min is None or df_15min.empty:
+            self._mtf_key = None
+            return self._mtf_alignment(None)
+        
+        # 各时间框架最新K线未变时直接返回上次结果
+        ohlc = self._mtf_ohlc(data)
+        key = tuple(o.get('key') for o in ohlc.values())
+        if key == self._mtf_key:
+            return self._mtf_result
+        self._mtf_key = key
+        return self._mtf_alignment(ohlc)
+    
+    def _frame_ohlc(self, df: Optional[pd.DataFrame]) -> Dict:
+        """可选时间框架转为 OHLC 数组，缺失或为空时返回空数组占位"""
+        return self._to_ohlc(df) if df is not None and len(df) else _EMPTY_OHLC
+    
+    def _mtf_ohlc(self, data: Dict[str, pd.DataFrame]) -> Dict[str, Dict]:
+        """各时间框架 DataFrame 一次性转为 OHLC 数组 (空数据为空数组占位)"""
+        return {tf: self._frame_ohlc(data.get(tf)) for tf in ('15min', '1hr', '4hr')}
+    
+    def _mtf_alignment(self, ohlc: Optional[Dict[str, Dict]]) -> Dict:
+        """
+        基于 OHLC 数组的多时间框架对齐分析
+        
+        结果写入预分配的 self._mtf_result 并返回同一个字典，
+        需要长期保存时由调用方 dict(...) 复制。'fvgs' 为15分钟近期 FVG 列表
+        (与 detect_fvg(df_15min) 相同)，调用方无需再次检测。
+        """
+        result = self._mtf_result
+        result.update(_MTF_DEFAULTS)
+        
+        if not ohlc or not len(ohlc['15min']['high']):
             return result
         
-        df_15min = data['15min']
-        df_1hr = data.get('1hr', pd.DataFrame())
-        df_4hr = data.get('4hr', pd.DataFrame())
-        
-        result['trend_4hr'] = self.get_trend(df_4hr) if len(df_4hr) >= 5 else 'unknown'
-        result['trend_1hr'] = self.get_trend(df_1hr) if len(df_1hr) >= 5 else 'unknown'
-        result['trend_15min'] = self.get_trend(df_15min)
-        
-        high_liq, low_liq = self.get_liquidity(df_15min)
+        o15 = ohlc['15min']
+        o1h = ohlc['1hr']
+        o4h = ohlc['4hr']
+        
+        # FVG 列表只检测一次 (带缓存)，方向标志由列表得出
+        fvgs = self._fvg(o15, 10)
+        fvg_bull = any(f['type'] == 'bullish' for f in fvgs)
+        fvg_bear = any(f['type'] == 'bearish' for f in fvgs)
+        
+        t4, t1, t15, high_liq, low_liq, score, direction = _mtf_trend(
+            o4h['high'], o4h['low'], o1h['high'], o1h['low'],
+            o15['high'], o15['low'], float(Config.FVG_SENSITIVITY), fvg_bull, fvg_bear)
+        
+        result['trend_4hr'] = _TREND_NAMES[t4]
+        result['trend_1hr'] = _TREND_NAMES[t1]
+        result['trend_15min'] = _TREND_NAMES[t15]
+        result['fvg_bullish'] = fvg_bull
+        result['fvg_bearish'] = fvg_bear
+        result['fvgs'] = fvgs
         result['liquidity_high'] = high_liq
         result['liquidity_low'] = low_liq
-        
-        fvgs = self.detect_fvg(df_15min)
-        for fvg in fvgs:
-            if fvg['type'] == 'bullish':
-                result['fvg_bullish'] = True
-            elif fvg['type'] == 'bearish':
-                result['fvg_bearish'] = True
-        
-        score = 0
-        direction = None
-        
-        if result['trend_4hr'] == 'bullish':
-            score += 2
-        elif result['trend_4hr'] == 'bearish':
-            score -= 2
-        
-        if result['trend_1hr'] == 'bullish':
-            score += 2
-        elif result['trend_1hr'] == 'bearish':
-            score -= 2
-        elif result['trend_1hr'] == 'ranging':
-            score += 1
-        
-        if result['trend_15min'] == 'bullish' and result['fvg_bullish']:
-            score += 3
-            direction = 'BUY'
-        elif result['trend_15min'] == 'bearish' and result['fvg_bearish']:
-            score -= 3
-            direction = 'SELL'
-        
         result['alignment_score'] = score
         result['direction'] = direction
         
@@ -175,193 +505,257 @@ class ICTSMCV2Strategy:
     def generate_signal(self, data: Dict[str, pd.DataFrame], current_price: float,
                         current_time: datetime = None) -> Optional[Dict]:
         """生成交易信号"""
-        if self.active_trade:
-            return None
-        
-        if current_time and self.last_signal_time:
-            if (current_time - self.last_signal_time).total_seconds() < 300:
-                return None
-        
-        if not data or not data.get('15min') or data['15min'].empty:
+        if self._in_trade or self._in_cooldown(current_time):
             return None
         
-        df_15min = data['15min']
-        if len(df_15min) < 20:
+        df_15min = data.get('15min') if data else None
+        if df_15min is None or len(df_15min) < 20:
             return None
         
-        mtf = self.analyze_mtf_alignment(data)
-        direction = mtf['direction']
-        
-        if not direction:
+        o15 = self._to_ohlc(df_15min)
+        o1h = self._frame_ohlc(data.get('1hr'))
+        o4h = self._frame_ohlc(data.get('4hr'))
+        
+        # 没有新K线时复用上一次的多时间框架分析
+        key = (o15['key'], o1h.get('key'), o4h.get('key'))
+        signal = self._fast_signal(o4h['high'], o4h['low'], o1h['high'], o1h['low'],
+                                   o15['high'], o15['low'], current_price, key)
+        if signal:
+            self.last_signal_time = current_time
+        return signal
+    
+    def generate_signal_fast(self, h15: np.ndarray, l15: np.ndarray, current_price: float,
+                             current_time: datetime = None,
+                             h1: np.ndarray = None, l1: np.ndarray = None,
+                             h4: np.ndarray = None, l4: np.ndarray = None,
+                             key=None) -> Optional[Dict]:
+        """
+        基于价格数组生成交易信号 (不经过 DataFrame)
+        
+        调用方直接传入各时间框架的最高/最低价数组，计算由编译内核完成，
+        信号与 generate_signal 相同。
+        
+        Args:
+            h15, l15: 15分钟最高/最低价
+            current_price: 当前价格
+            current_time: 当前时间 (信号冷却)
+            h1, l1, h4, l4: 1小时/4小时最高/最低价，缺省视为无数据
+            key: 最新K线标识，不变期间复用与价格无关的分析结果
+            
+        Returns:
+            Optional[Dict]: 交易信号
+        """
+        if self._in_trade or self._in_cooldown(current_time):
             return None
         
-        confidence = 0.5
-        
-        if mtf['alignment_score'] >= 5:
-            confidence = 0.85
-        elif mtf['alignment_score'] >= 3:
-            confidence = 0.7
-        
-        if mtf['trend_4hr'] == direction.lower():
-            confidence += 0.1
-        
-        fvgs = self.detect_fvg(df_15min)
-        for fvg in fvgs[-3:]:
-            if direction == 'BUY' and fvg['type'] == 'bullish':
-                if fvg['low'] <= current_price <= fvg['high'] + 10:
-                    confidence += 0.15
-                    break
-            elif direction == 'SELL' and fvg['type'] == 'bearish':
-                if fvg['high'] >= current_price >= fvg['low'] - 10:
-                    confidence += 0.15
-                    break
-        
-        high_liq = mtf['liquidity_high']
-        low_liq = mtf['liquidity_low']
-        
-        if direction == 'BUY':
-            if high_liq <= current_price:
-                return None
-            risk_distance = current_price - low_liq + 5
-            stop_loss = low_liq - 5
-        else:
-            if low_liq >= current_price:
-                return None
-            risk_distance = high_liq + 5 - current_price
-            stop_loss = high_liq + 5
-        
-        if risk_distance <= 0 or risk_distance > 100:
+        if len(h15) < 20:
             return None
         
-        self.last_signal_time = current_time
-        
-        return {
-            'action': direction,
-            'entry_price': current_price,
-            'stop_loss': stop_loss,
-            'risk_distance': risk_distance,
-            'take_profit': current_price + risk_distance * 4 if direction == 'BUY' else current_price - risk_distance * 4,
-            'confidence': min(confidence, 1.0),
-            'trend_4hr': mtf['trend_4hr'],
-            'trend_1hr': mtf['trend_1hr'],
-            'trend_15min': mtf['trend_15min'],
-            'alignment_score': mtf['alignment_score']
-        }
+        empty = _EMPTY_OHLC['high']
+        signal = self._fast_signal(h4 if h4 is not None else empty, l4 if l4 is not None else empty,
+                                   h1 if h1 is not None else empty, l1 if l1 is not None else empty,
+                                   h15, l15, current_price, key)
+        if signal:
+            self.last_signal_time = current_time
+        return signal
+    
+    def _in_cooldown(self, current_time: Optional[datetime]) -> bool:
+        """距上次信号不足5分钟"""
+        if current_time and self.last_signal_time:
+            return (current_time - self.last_signal_time).total_seconds() < 300
+        return False
     
-    def update_trade(self, current_price: float, current_time) -> Dict:
+    def update_trade(self, current_price: float, current_time: Optional[datetime]) -> Dict:
         """更新交易状态"""
-        if not self.active_trade:
+        if self.active_trade is None:
             return {'action': 'hold'}
         
-        t = self.active_trade
-        entry = t['entry_price']
-        risk = t['risk_distance']
-        
-        if t['action'] == 'BUY':
-            unrealized_rr = (current_price - entry) / risk
-        else:
-            unrealized_rr = (entry - current_price) / risk
-        
-        for level, config in sorted(self.TRAIL_LEVELS.items()):
-            if unrealized_rr >= level and t['trail_level'] < level:
-                t['trail_level'] = level
-                
-                if config['action'] == 'partial' and not t['partial_filled']:
-                    t['partial_filled'] = True
-                    t['partial_size'] = t['size'] // 2
-                    t['size'] = t['size'] - t['partial_size']
-                    
-                    if t['action'] == 'BUY':
-                        t['stop_loss'] = entry + risk * config['trail_stop']
-                    else:
-                        t['stop_loss'] = entry - risk * config['trail_stop']
-                    
-                    return {
-                        'action': 'partial_close',
-                        'size': t['partial_size'],
-                        'price': current_price,
-                        'rr': unrealized_rr,
-                        'new_stop_loss': t['stop_loss']
-                    }
+        t: ActiveTrade = self.active_trade
+        entry: float = t.entry_price
+        risk: float = t.risk_distance
+        sign: int = t.sign  # 多头 1 / 空头 -1，开仓时确定
+        
+        unrealized_rr: float = sign * (current_price - entry) / risk
+        
+        # trail_level 只增不减: 二分定位到下一个未触发级别，只比较这一档
+        # (已成交的 partial 级别不返回，继续检查后一档)
+        thresholds: Tuple[float, ...] = self._trail_thresholds
+        i: int = bisect_right(thresholds, t.trail_level)
+        level: float
+        action: str
+        trail_stop: float
+        while i < len(thresholds) and unrealized_rr >= thresholds[i]:
+            level, action, trail_stop = self._trail_levels_sorted[i]
+            i += 1
+            t.trail_level = level
+            
+            if action == 'partial' and not t.partial_filled:
+                t.partial_filled = True
+                t.partial_size = t.size // 2
+                t.size = t.size - t.partial_size
+                t.stop_loss = entry + sign * risk * trail_stop
+                # 部分平仓盈亏按当前价结算，计入整笔交易盈亏
+                t.pnl = self._compute_pnl(t, current_price, t.partial_size)
                 
-                elif config['action'] == 'trail':
-                    if t['action'] == 'BUY':
-                        t['stop_loss'] = entry + risk * config['trail_stop']
-                    else:
-                        t['stop_loss'] = entry - risk * config['trail_stop']
-                    
-                    return {
-                        'action': 'trail_stop',
-                        'new_stop_loss': t['stop_loss'],
-                        'rr': unrealized_rr
-                    }
+                return {
+                    'action': 'partial_close',
+                    'size': t.partial_size,
+                    'price': current_price,
+                    'pnl': t.pnl,
+                    'rr': unrealized_rr,
+                    'new_stop_loss': t.stop_loss
+                }
+            
+            elif action == 'trail':
+                t.stop_loss = entry + sign * risk * trail_stop
                 
-                elif config['action'] == 'close':
-                    t['pnl'] = (t['take_profit'] - entry) * t['size'] * 2
-                    if t.get('partial_size', 0) > 0:
-                        t['pnl'] += (t['take_profit'] - entry) * t['partial_size'] * 2
-                    
-                    result = {
-                        'action': 'close',
-                        'pnl': t['pnl'],
-                        'rr': unrealized_rr,
-                        'reason': '4R止盈'
-                    }
-                    self.active_trade = None
-                    return result
-        
-        if t['action'] == 'BUY':
-            if current_price <= t['stop_loss']:
-                t['pnl'] = (t['stop_loss'] - entry) * t['size'] * 2
-                if t.get('partial_size', 0) > 0:
-                    t['pnl'] += (t['stop_loss'] - entry) * t['partial_size'] * 2
+                return {
+                    'action': 'trail_stop',
+                    'new_stop_loss': t.stop_loss,
+                    'rr': unrealized_rr
+                }
+            
+            elif action == 'close':
+                pnl = self._compute_pnl(t, t.take_profit, t.size)
+                t.pnl += pnl
                 
-                result = {'action': 'close', 'pnl': t['pnl'], 'rr': unrealized_rr, 'reason': '止损'}
+                result = {
+                    'action': 'close',
+                    'pnl': pnl,
+                    'rr': unrealized_rr,
+                    'reason': '4R止盈'
+                }
                 self.active_trade = None
+                self._in_trade = False
                 return result
         
-        else:
-            if current_price >= t['stop_loss']:
-                t['pnl'] = (entry - t['stop_loss']) * t['size'] * 2
-                if t.get('partial_size', 0) > 0:
-                    t['pnl'] += (entry - t['stop_loss']) * t['partial_size'] * 2
-                
-                result = {'action': 'close', 'pnl': t['pnl'], 'rr': unrealized_rr, 'reason': '止损'}
-                self.active_trade = None
-                return result
+        # 价格越过止损: 多头 current <= stop，空头 current >= stop
+        if sign * (current_price - t.stop_loss) <= 0:
+            pnl = self._compute_pnl(t, t.stop_loss, t.size)
+            t.pnl += pnl
+            
+            result = {'action': 'close', 'pnl': pnl, 'rr': unrealized_rr, 'reason': '止损'}
+            self.active_trade = None
+            self._in_trade = False
+            return result
         
         return {'action': 'hold', 'current_rr': unrealized_rr}
     
-    def open_position(self, signal: Dict, position_size: int):
-        """开仓"""
-        if self.active_trade:
+    @staticmethod
+    def _compute_pnl(t: ActiveTrade, exit_price: float, size: int) -> float:
+        """按退出价计算 size 手的盈亏 (partial_close 与 close 各自只结算本次平掉的仓位)"""
+        return t.sign * (exit_price - t.entry_price) * size * _MNQ_MULTIPLIER
+    
+    def open_position(self, signal: Dict, position_size: int, now: datetime = None):
+        """开仓 (now 由调用方传入同一轮循环的时间，缺省时取当前时间)"""
+        if self.active_trade is not None:
             return None
         
-        self.active_trade = {
-            'action': signal['action'],
-            'entry_price': signal['entry_price'],
-            'stop_loss': signal['stop_loss'],
-            'take_profit': signal['take_profit'],
-            'risk_distance': signal['risk_distance'],
-            'size': position_size,
-            'trail_level': 0,
-            'partial_filled': False,
-            'partial_size': 0,
-            'open_time': datetime.now()
-        }
+        self.active_trade = ActiveTrade(
+            signal['action'], signal['entry_price'], signal['stop_loss'],
+            signal['take_profit'], signal['risk_distance'], position_size,
+            now if now is not None else datetime.now()
+        )
+        self._in_trade = True
         
         return self.active_trade
     
+    @property
+    def in_trade(self) -> bool:
+        """是否持仓中"""
+        return self._in_trade
+    
     def get_status(self) -> Dict:
         """获取策略状态"""
-        if self.active_trade:
-            return {'status': 'active', 'trade': self.active_trade}
+        if self.active_trade is not None:
+            return {'status': 'active', 'trade': self.active_trade.to_dict()}
         return {'status': 'idle'}
     
     def reset(self):
         """重置策略状态"""
         self.active_trade = None
+        self._in_trade = False
+        self._fvg_cache.clear()
+        self._fvg_all_key = None
+        self._fvg_all = None
+        self._mtf_key = None
         self.last_signal_time = None
+    
+    def generate_signals_batch(self, per_symbol_data: Dict[str, Dict],
+                               max_workers: int = None,
+                               executor: Executor = None) -> Dict[str, Optional[Dict]]:
+        """
+        多品种并行生成信号
+        
+        持仓/冷却判断和 DataFrame -> 价格数组的转换在本进程完成，子进程只收到
+        各时间框架的最高/最低价数组与当前价，用进程内的 make_signal_fn 计算。
+        不修改本实例状态。
+        
+        Args:
+            per_symbol_data: {品种: {'data': 多时间框架数据, 'price': 当前价, 'time': 当前时间}}
+            max_workers: 进程数，默认 CPU 核数 (仅在首次创建本实例的进程池时使用)
+            executor: 调用方持有的执行器；缺省时使用本实例的进程池
+                (首次调用时创建，跨 tick 复用，由 shutdown_pool() 关闭)
+            
+        Returns:
+            Dict[str, Optional[Dict]]: {品种: 信号或 None}
+        """
+        if not per_symbol_data:
+            return {}
+        
+        results = dict.fromkeys(per_symbol_data)
+        if self._in_trade:
+            return results
+        
+        pool = executor
+        futures = {}
+        for symbol, item in per_symbol_data.items():
+            if self._in_cooldown(item.get('time')):
+                continue
+            data = item['data']
+            df_15min = data.get('15min') if data else None
+            if df_15min is None or len(df_15min) < 20:
+                continue
+            o15 = self._to_ohlc(df_15min)
+            o1h = self._frame_ohlc(data.get('1hr'))
+            o4h = self._frame_ohlc(data.get('4hr'))
+            if pool is None:
+                pool = self._get_pool(max_workers)
+            futures[symbol] = pool.submit(_signal_worker, o4h['high'], o4h['low'],
+                                          o1h['high'], o1h['low'], o15['high'], o15['low'],
+                                          item['price'])
+        
+        for symbol, future in futures.items():
+            try:
+                results[symbol] = future.result()
+            except Exception as e:
+                logger.error("%s 信号计算失败: %s", symbol, e)
+        return results
+    
+    def _get_pool(self, max_workers: int = None) -> ProcessPoolExecutor:
+        """本实例的信号进程池 (首次使用时创建)"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=max_workers)
+        return self._pool
+    
+    def shutdown_pool(self):
+        """关闭 generate_signals_batch 创建的进程池"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+# 子进程内的信号计算函数 (每个进程首次任务时创建，之后复用)
+_worker_signal_fn = None
+
+
+def _signal_worker(h4: np.ndarray, l4: np.ndarray, h1: np.ndarray, l1: np.ndarray,
+                   h15: np.ndarray, l15: np.ndarray, current_price: float) -> Optional[Dict]:
+    """进程池任务: 由价格数组生成单个品种的信号"""
+    global _worker_signal_fn
+    if _worker_signal_fn is None:
+        _worker_signal_fn = make_signal_fn()
+    return _worker_signal_fn(h4, l4, h1, l1, h15, l15, current_price)
 
 
 class RiskManagerV1:
@@ -370,24 +764,19 @@ class RiskManagerV1:
     def __init__(self):
         self.max_position = Config.MAX_POSITION_SIZE
         self.risk_pct = Config.RISK_PERCENTAGE
+        
+        # 百分比预先换算成比例
+        self._risk_frac = self.risk_pct / 100.0
+        self._daily_loss_frac = Config.DAILY_LOSS_LIMIT / 100.0
     
     def calculate_position_size(self, capital: float, entry_price: float, 
                              stop_loss: float) -> int:
-        if capital <= 0:
-            return 0
-        
-        risk_amount = capital * (self.risk_pct / 100)
-        risk_per_contract = abs(entry_price - stop_loss) * 2
-        
-        if risk_per_contract <= 0:
-            return 1
-        
-        size = int(risk_amount / risk_per_contract)
-        return min(size, self.max_position)
+        # 统一转为 float，编译内核只生成一个特化版本
+        return position_size(float(capital), float(entry_price), float(stop_loss),
+                             self._risk_frac, _MNQ_MULTIPLIER, self.max_position)
     
     def should_trade(self, capital: float, daily_pnl: float) -> bool:
-        daily_loss_limit = capital * (Config.DAILY_LOSS_LIMIT / 100)
-        if abs(daily_pnl) >= daily_loss_limit:
+        if abs(daily_pnl) >= capital * self._daily_loss_frac:
             return False
         if capital < 1000:
             return False
@@ -0,0 +1,109 @@
+"""
+strategy_v1 单元测试 (python -m pytest -q)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from strategy_v1 import ICTSMCV2Strategy, make_signal_fn
+
+
+_NOW = datetime(2024, 1, 2, 10, 0)
+
+
+def _frame(rng, n, freq):
+    close = np.cumsum(rng.normal(0, 6, n)) + 20000
+    return pd.DataFrame({'open': close, 'high': close + rng.random(n) * 8,
+                         'low': close - rng.random(n) * 8, 'close': close, 'volume': 1.0},
+                        index=pd.date_range('2024-01-02', periods=n, freq=freq))
+
+
+def _open(strategy, action, entry, stop, take_profit, size):
+    signal = {'action': action, 'entry_price': entry, 'stop_loss': stop,
+              'take_profit': take_profit, 'risk_distance': abs(entry - stop)}
+    return strategy.open_position(signal, size, _NOW)
+
+
+def test_sell_4r_take_profit_pnl_is_positive():
+    strategy = ICTSMCV2Strategy(trail_levels=[(4.0, 'close', 3.0)])
+    _open(strategy, 'SELL', 100.0, 110.0, 60.0, 1)
+
+    result = strategy.update_trade(60.0, _NOW)
+
+    assert result['action'] == 'close'
+    assert result['reason'] == '4R止盈'
+    # 空头 100 -> 60，1 手 * 40 点 * $2
+    assert result['pnl'] == pytest.approx(80.0)
+    assert strategy.active_trade is None
+
+
+def test_partial_close_books_its_own_pnl():
+    strategy = ICTSMCV2Strategy()
+    trade = _open(strategy, 'BUY', 100.0, 90.0, 140.0, 3)
+
+    partial = strategy.update_trade(115.0, _NOW)
+    assert partial['action'] == 'partial_close'
+    assert partial['size'] == 1
+    # 1 手 * 15 点 * $2
+    assert partial['pnl'] == pytest.approx(30.0)
+    assert partial['new_stop_loss'] == pytest.approx(105.0)
+
+    close = strategy.update_trade(104.0, _NOW)
+    assert close['action'] == 'close'
+    assert close['reason'] == '止损'
+    # 剩余 2 手在 105 止损，部分平仓的 1 手不重复结算
+    assert close['pnl'] == pytest.approx(20.0)
+    assert partial['pnl'] + close['pnl'] == pytest.approx(trade.pnl)
+
+
+def test_make_signal_fn_matches_generate_signal():
+    rng = np.random.default_rng(3)
+    signal_fn = make_signal_fn()
+    signals = 0
+    for _ in range(300):
+        data = {'15min': _frame(rng, int(rng.integers(20, 60)), '15min'),
+                '1hr': _frame(rng, int(rng.integers(0, 30)), '1h'),
+                '4hr': _frame(rng, int(rng.integers(0, 30)), '4h')}
+        price = float(data['15min']['close'].iat[-1]) + rng.normal(0, 5)
+        arrays = [data[tf][col].to_numpy() for tf in ('4hr', '1hr', '15min') for col in ('high', 'low')]
+
+        strategy = ICTSMCV2Strategy()
+        expected = strategy.generate_signal(data, price)
+        alignment = strategy.analyze_mtf_alignment(data)
+        result = signal_fn(*arrays, price)
+
+        assert result == expected
+        if result is None:
+            continue
+        signals += 1
+        # 两条路径的趋势与评分一致
+        assert result['action'] == alignment['direction']
+        assert result['alignment_score'] == alignment['alignment_score']
+        for tf in ('trend_4hr', 'trend_1hr', 'trend_15min'):
+            assert result[tf] == alignment[tf]
+    assert signals > 0
+
+
+def test_generate_signals_batch_matches_generate_signal():
+    rng = np.random.default_rng(5)
+    per_symbol = {}
+    for k in range(8):
+        data = {'15min': _frame(rng, 60, '15min'), '1hr': _frame(rng, 20, '1h'),
+                '4hr': _frame(rng, 20, '4h')}
+        per_symbol['S%d' % k] = {'data': data, 'price': float(data['15min']['close'].iat[-1])}
+    per_symbol['short'] = {'data': {'15min': _frame(rng, 5, '15min')}, 'price': 20000.0}
+
+    strategy = ICTSMCV2Strategy()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = strategy.generate_signals_batch(per_symbol, executor=executor)
+
+    expected = {symbol: ICTSMCV2Strategy().generate_signal(item['data'], item['price'])
+                for symbol, item in per_symbol.items()}
+    assert results == expected
+    assert any(signal is not None for signal in results.values())
+    # 传入执行器时不创建本实例的进程池
+    assert strategy._pool is None
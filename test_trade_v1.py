@@ -0,0 +1,133 @@
+"""
+trade_v1 行情生产者 / 策略消费者流水线测试 (python -m pytest -q)
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from strategy_v1 import ICTSMCV2Strategy
+from trade_v1 import TradingV1
+
+
+def _frame(i, close=None):
+    return pd.DataFrame({'open': [1.0], 'high': [2.0], 'low': [0.0],
+                         'close': [float(i if close is None else close)], 'volume': [1.0]},
+                        index=[datetime(2024, 1, 2) + timedelta(minutes=15 * i)])
+
+
+class _Strategy:
+    active_trade = None
+
+    def __init__(self):
+        self.prices = []
+
+    def is_trading_session(self, now):
+        return 'extended'
+
+    def generate_signal_fast(self, highs, lows, current_price, now, key=None):
+        self.prices.append(current_price)
+        # 只对第一份行情给出信号，消费者随后阻塞在下单上
+        if len(self.prices) == 1:
+            return {'action': 'BUY', 'entry_price': current_price, 'stop_loss': 0.0}
+        return None
+
+    def open_position(self, signal, size, now):
+        return None
+
+
+class _Risk:
+    def should_trade(self, capital, daily_pnl):
+        return True
+
+    def calculate_position_size(self, capital, entry_price, stop_loss):
+        return 1
+
+
+class _IBKR:
+    def __init__(self, order_gate):
+        self.order_gate = order_gate
+
+    def get_account_value(self):
+        return 100000.0
+
+    async def place_market_order(self, action, size):
+        await self.order_gate.wait()
+        return 1
+
+
+def test_consumer_sees_latest_frame_and_exits_on_stop():
+    async def scenario():
+        trading = TradingV1()
+        order_gate = asyncio.Event()
+        trading.strategy = _Strategy()
+        trading.risk = _Risk()
+        trading.ibkr = _IBKR(order_gate)
+        calls = []
+
+        async def get_market_data():
+            calls.append(1)
+            n = len(calls)
+            if n <= 4:
+                return _frame(n)
+            # 消费者阻塞期间已发布 2、3、4 三份行情，放行后只应处理最新一份
+            order_gate.set()
+            for _ in range(5):
+                await asyncio.sleep(0)
+            trading.request_stop()
+            return None
+
+        async def idle(seconds):
+            await asyncio.sleep(0)
+
+        trading.get_market_data = get_market_data
+        trading._idle = idle
+        await asyncio.wait_for(trading.run(), timeout=5)
+        return trading.strategy.prices
+
+    assert asyncio.run(scenario()) == [1.0, 4.0]
+
+
+class _SessionStrategy(ICTSMCV2Strategy):
+    """不受运行时刻影响的交易时段"""
+
+    def is_trading_session(self, dt):
+        return 'extended'
+
+
+def test_consumer_books_partial_and_close_pnl():
+    async def scenario():
+        trading = TradingV1()
+        trading.strategy = _SessionStrategy()
+        trading.risk = _Risk()
+        trading.ibkr = _IBKR(asyncio.Event())
+        trading.ibkr.order_gate.set()
+        # 多头 100 开仓，止损 90 (1R = 10 点)，3 手
+        trading.strategy.open_position({'action': 'BUY', 'entry_price': 100.0, 'stop_loss': 90.0,
+                                        'take_profit': 140.0, 'risk_distance': 10.0}, 3)
+        # 115 (1.5R) 半仓平仓 1 手并上移止损到 105，104 触发止损平掉剩余 2 手
+        closes = [115.0, 104.0]
+        calls = []
+
+        async def get_market_data():
+            calls.append(1)
+            if len(calls) <= len(closes):
+                return _frame(len(calls), closes[len(calls) - 1])
+            trading.request_stop()
+            return None
+
+        async def idle(seconds):
+            for _ in range(3):
+                await asyncio.sleep(0)
+
+        trading.get_market_data = get_market_data
+        trading._idle = idle
+        await asyncio.wait_for(trading.run(), timeout=5)
+        return trading
+
+    trading = asyncio.run(scenario())
+    assert trading.strategy.active_trade is None
+    # 半仓 1 手 * 15 点 * $2 + 剩余 2 手 * 5 点 * $2
+    assert trading.daily_pnl == pytest.approx(30.0 + 20.0)
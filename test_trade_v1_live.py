@@ -0,0 +1,65 @@
+"""
+trade_v1_live 交易主循环测试 (python -m pytest -q)
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from trade_v1_live import LiveTradingV2
+
+
+_NOW = datetime(2024, 1, 2, 10, 0)
+
+
+class _DataManager:
+    """只提供最新价格；revision 与初始值相同，主循环不重新取K线数组"""
+
+    revision = -1
+
+    def __init__(self, prices):
+        self.prices = list(prices)
+
+    async def update_async(self):
+        return set()
+
+    def get_current_price(self):
+        return self.prices.pop(0)
+
+
+class _Monitor:
+    connected = True
+
+
+class _OrderManager:
+    def __init__(self):
+        self.cancelled = 0
+
+    def cancel_all(self, keep=()):
+        self.cancelled += 1
+        return 0
+
+
+def test_trade_log_records_partial_plus_remainder():
+    trading = LiveTradingV2(initial_capital=100000)
+    # 115 (1.5R) 半仓平仓 1 手并上移止损到 105，104 触发止损平掉剩余 2 手
+    trading.data_manager = _DataManager([115.0, 104.0])
+    trading.monitor = _Monitor()
+    trading.order_manager = _OrderManager()
+    trading._last_day = _NOW.toordinal()
+    trading._mtf_ready = True
+    trading.strategy.open_position({'action': 'BUY', 'entry_price': 100.0, 'stop_loss': 90.0,
+                                    'take_profit': 140.0, 'risk_distance': 10.0}, 3, _NOW)
+
+    asyncio.run(trading._on_new_bar(_NOW))
+    assert trading.trade_log.n == 0
+    asyncio.run(trading._on_new_bar(_NOW))
+
+    # 半仓 1 手 * 15 点 * $2 + 剩余 2 手 * 5 点 * $2
+    records = trading.trade_log.to_records()
+    assert len(records) == 1
+    assert records['pnl'][0] == pytest.approx(30.0 + 20.0)
+    assert records['side'][0] == 1
+    assert trading.trade_log.total_pnl() == pytest.approx(trading.daily_pnl)
+    assert trading.order_manager.cancelled == 1
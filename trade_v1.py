@@ -8,11 +8,18 @@ CLAWA IBKR MNQ V1.0 自动化交易系统
 import asyncio
 import signal
 import sys
+
+try:
+    import uvloop  # 可选: 更快的事件循环实现
+except ImportError:
+    uvloop = None
+
 from datetime import datetime
+import pandas as pd
 from config import Config
 from logger import logger
 from ibkr_client import IBKRClient
-from strategy_v1 import ICTSMCV1Strategy, RiskManagerV1
+from strategy_v1 import ICTSMCV2Strategy, RiskManagerV1
 
 
 class TradingV1:
@@ -20,20 +27,27 @@ class TradingV1:
     
     def __init__(self):
         self.ibkr = IBKRClient()
-        self.strategy = ICTSMCV1Strategy()
+        self.strategy = ICTSMCV2Strategy()
         self.risk = RiskManagerV1()
         self.running = False
         self.daily_pnl = 0.0
         
+        # K线 DataFrame 缓存: 只在出现新K线时追加，避免每次轮询重建
+        self._bars_df = None
+        self._last_bar_ts = None
+        self._last_bar = None
+        self._bar_queue = None  # 行情生产者 -> 策略消费者
+        self._stop_event = None  # 停止信号置位后，生产者的等待立即结束
+        
     async def initialize(self) -> bool:
         """初始化"""
         logger.info("=" * 60)
         logger.info("CLAWA IBKR MNQ V1.0 交易系统启动")
         logger.info("=" * 60)
-        logger.info(f"策略: ICT/SMC 移动止损策略 V1.0")
-        logger.info(f"交易时段: 07:00-20:00 CST")
-        logger.info(f"最大持仓: {Config.MAX_POSITION_SIZE} 手")
-        logger.info(f"风险比例: {Config.RISK_PERCENTAGE}%")
+        logger.info("策略: ICT/SMC 移动止损策略 V1.0")
+        logger.info("交易时段: 07:00-20:00 CST")
+        logger.info("最大持仓: %s 手", Config.MAX_POSITION_SIZE)
+        logger.info("风险比例: %s%%", Config.RISK_PERCENTAGE)
         
         if not await self.ibkr.connect():
             logger.error("连接 IBKR 失败")
@@ -51,44 +65,108 @@ class TradingV1:
         if not data:
             return None
         
-        df = pd.DataFrame(data)
-        df.set_index('date', inplace=True)
+        last = data[-1]
+        if self._bars_df is not None and last == self._last_bar:
+            return self._bars_df
+        
+        if self._bars_df is None:
+            df = pd.DataFrame(data).set_index('date')
+        else:
+            # 只取缓存最后一根(可能仍在形成中)及之后的K线，替换缓存末行后追加
+            i = len(data)
+            while i > 0 and data[i - 1]['date'] >= self._last_bar_ts:
+                i -= 1
+            new_rows = pd.DataFrame(data[i:]).set_index('date')
+            df = pd.concat([self._bars_df.iloc[:-1], new_rows]).iloc[-len(data):]
+        
+        self._bars_df = df
+        self._last_bar_ts = last['date']
+        self._last_bar = last
         return df
     
     async def run(self):
-        """主循环"""
+        """主循环: 行情获取与策略计算流水线并行"""
         self.running = True
-        
+        self._stop_event = asyncio.Event()
+        # 只保留最新一份行情，策略来不及处理时旧数据直接被替换
+        self._bar_queue = asyncio.Queue(maxsize=1)
+        await asyncio.gather(self._data_producer(), self._strategy_consumer())
+    
+    def request_stop(self, signum=None):
+        """停止信号回调: 结束行情轮询，策略消费者处理完当前行情后退出"""
+        logger.info("收到信号 %s", signum)
+        self.running = False
+        if self._stop_event is not None:
+            self._stop_event.set()
+    
+    async def _idle(self, seconds: float):
+        """轮询间隔等待，收到停止信号时提前返回"""
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+    
+    def _publish(self, item):
+        """放入最新行情 (队列已满时丢弃尚未处理的旧数据)"""
+        if self._bar_queue.full():
+            self._bar_queue.get_nowait()
+        self._bar_queue.put_nowait(item)
+    
+    async def _data_producer(self):
+        """行情生产者: 轮询 IBKR，把 (时间, DataFrame, 最新收盘价) 放入队列"""
         while self.running:
             try:
                 now = datetime.now()
                 session = self.strategy.is_trading_session(now)
                 
                 if not session:
-                    logger.debug(f"当前 {now.strftime('%H:%M')} 不在交易时段")
-                    await asyncio.sleep(60)
+                    logger.debug("当前 %02d:%02d 不在交易时段", now.hour, now.minute)
+                    await self._idle(60)
                     continue
                 
                 # 获取数据
                 df = await self.get_market_data()
                 if df is None:
-                    await asyncio.sleep(30)
+                    await self._idle(30)
                     continue
                 
-                current_price = df['close'].iloc[-1]
+                # 价格取自同一份行情并随之入队，消费者不读取生产者的状态
+                self._publish((now, df, float(df['close'].iat[-1])))
+                await self._idle(60)
                 
+            except Exception as e:
+                logger.error("行情获取错误: %s", e)
+                await self._idle(30)
+        
+        # 通知消费者退出
+        self._publish(None)
+    
+    async def _strategy_consumer(self):
+        """策略消费者: 信号生成与交易管理，与下一次行情请求并行"""
+        while True:
+            item = await self._bar_queue.get()
+            if item is None:
+                break
+            now, df, current_price = item
+            
+            try:
                 # 检查风险管理
                 if not self.risk.should_trade(self.ibkr.get_account_value(), self.daily_pnl):
                     logger.warning("风险管理阻止交易")
-                    await asyncio.sleep(60)
                     continue
                 
-                # 获取策略状态
-                status = self.strategy.get_status()
+                # 直接读取持仓对象 (平仓后 active_trade 会被清空，先保留引用)
+                trade = self.strategy.active_trade
                 
-                if status['status'] == 'idle':
+                if trade is None:
                     # 生成信号
-                    signal = self.strategy.generate_signal(df, current_price)
+                    # 只有15分钟数据: 直接传价格数组，由编译内核计算
+                    # (最新K线仍在形成时高低点会变，一并作为缓存键)
+                    highs = df['high'].to_numpy()
+                    lows = df['low'].to_numpy()
+                    signal = self.strategy.generate_signal_fast(
+                        highs, lows, current_price, now,
+                        key=(len(df), df.index[-1], highs[-1], lows[-1]))
                     if signal:
                         # 计算仓位
                         size = self.risk.calculate_position_size(
@@ -99,8 +177,8 @@ class TradingV1:
                         
                         if size > 0:
                             # 开仓
-                            trade = self.strategy.open_position(signal, size)
-                            logger.info(f"开仓: {signal['action']} {size}手 @ {signal['entry_price']}")
+                            trade = self.strategy.open_position(signal, size, now)
+                            logger.info("开仓: %s %d手 @ %s", signal['action'], size, signal['entry_price'])
                             
                             # 下单
                             order_id = await self.ibkr.place_market_order(
@@ -108,36 +186,31 @@ class TradingV1:
                             )
                             
                             if order_id:
-                                logger.info(f"订单执行成功: {order_id}")
+                                logger.info("订单执行成功: %s", order_id)
                             else:
                                 logger.error("订单执行失败")
                                 self.strategy.reset()
                 
-                elif status['status'] == 'active':
+                else:
                     # 更新交易
                     result = self.strategy.update_trade(current_price, now)
                     
                     if result['action'] == 'partial_close':
-                        logger.info(f"半仓平仓 @ {result['price']}, RR: {result['rr']:.1f}R")
+                        logger.info("半仓平仓 @ %s, RR: %.1fR", result['price'], result['rr'])
                         self.daily_pnl += result['pnl']
                         
                     elif result['action'] == 'trail_stop':
-                        logger.info(f"移动止损 @ {result['new_stop_loss']}, RR: {result['rr']:.1f}R")
+                        logger.info("移动止损 @ %s, RR: %.1fR", result['new_stop_loss'], result['rr'])
                         
                     elif result['action'] == 'close':
-                        logger.info(f"平仓: {result['reason']}, PnL: ${result['pnl']:.2f}")
+                        logger.info("平仓: %s, PnL: $%.2f", result['reason'], result['pnl'])
                         self.daily_pnl += result['pnl']
                         
                         # 关闭订单
-                        action = 'SELL' if self.strategy.active_trade['action'] == 'BUY' else 'BUY'
-                        size = self.strategy.active_trade['size']
-                        await self.ibkr.place_market_order(action, size)
-                
-                await asyncio.sleep(60)
+                        await self.ibkr.place_market_order(trade.exit_action, trade.size)
                 
             except Exception as e:
-                logger.error(f"交易循环错误: {e}")
-                await asyncio.sleep(30)
+                logger.error("交易循环错误: %s", e)
     
     async def stop(self):
         """停止"""
@@ -146,17 +219,21 @@ class TradingV1:
         logger.info("V1.0 交易系统已停止")
 
 
-def signal_handler(signum, frame):
-    """信号处理"""
-    logger.info(f"收到信号 {signum}")
+def _install_signal_handlers(trading: TradingV1):
+    """SIGINT/SIGTERM 直接结束交易主循环"""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, trading.request_stop, sig)
+        except NotImplementedError:
+            # Windows 事件循环不支持 add_signal_handler
+            signal.signal(sig, lambda signum, frame: loop.call_soon_threadsafe(trading.request_stop, signum))
 
 
 async def main():
     """主入口"""
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    
     trading = TradingV1()
+    _install_signal_handlers(trading)
     
     try:
         if await trading.initialize():
@@ -168,5 +245,7 @@ async def main():
 
 
 if __name__ == "__main__":
-    import pandas as pd
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
@@ -10,91 +10,274 @@ CLAWA IBKR MNQ V2.1 实盘交易系统
 """
 
 import signal
+import time
+import random
+import logging
 import asyncio
-import nest_asyncio
-nest_asyncio.apply()
+import numpy as np
+from collections import OrderedDict
 
-from datetime import datetime
-from typing import Dict, Optional, Callable
+try:
+    import uvloop  # 可选: 更快的事件循环实现
+except ImportError:
+    uvloop = None
+
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Callable, Tuple
 from config import Config
 from logger import logger
 from strategy_v1 import ICTSMCV2Strategy, RiskManagerV1
 from data_manager import DataManager
+from kernels import as_price_array, warmup
 from ib_insync import IB, Future, LimitOrder, StopOrder, BracketOrder
 
 
+# 断线重连的退避延迟 (秒): 首次 0.1 秒，每次失败翻倍，最长 30 秒
+_RECONNECT_BASE_DELAY = 0.1
+_RECONNECT_MAX_DELAY = 30.0
+
+# 订单终态 (与 ib_insync OrderStatus.DoneStates 一致)
+_DONE_STATUSES = frozenset(('Filled', 'Cancelled', 'ApiCancelled', 'Inactive'))
+
+# TradeLog.to_records() 的记录类型，字段与 TradeLog 的列一致
+_TRADE_DTYPE = np.dtype([('entry', 'f8'), ('exit', 'f8'), ('pnl', 'f8'),
+                         ('rr', 'f8'), ('ts', 'datetime64[s]'), ('side', 'i1')])
+
+# 已成交/已取消订单记录的保留上限 (超过后丢弃最早的记录)
+_ORDER_HISTORY_CAP = 10_000
+
+# 空时间框架的价格数组占位
+_EMPTY_PRICES = np.empty(0)
+
+# 策略使用的时间框架及其在 (最高价, 最低价) 缓存列表中的下标
+_MTF_FRAMES = ('4hr', '1hr', '15min')
+_TF_4H, _TF_1H, _TF_15M = range(len(_MTF_FRAMES))
+
+# 多行交易日志模板: 每个事件一次 logger 调用, 参数惰性格式化
+_BRACKET_LOG = (
+    "📤 括号单已提交:\n"
+    "   入场 #%s: %s %s @ %s\n"
+    "   止损 #%s: %s %s @ %s\n"
+    "   止盈 #%s: %s %s @ %s"
+)
+_OPEN_SIGNAL_LOG = (
+    "\n" + "=" * 60 + "\n"
+    "📢 开仓信号: %s\n"
+    "   手数: %s | 入场: $%.2f\n"
+    "   止损: $%.2f | 止盈: $%.2f\n"
+    "   置信度: %.0f%%\n"
+    + "=" * 60
+)
+_PARTIAL_CLOSE_LOG = (
+    "\n" + "-" * 60 + "\n"
+    "✂️ 半仓平仓 @ $%.2f\n"
+    "   盈利: $%.2f | RR: %.1fR\n"
+    + "-" * 60
+)
+_TRAIL_STOP_LOG = (
+    "\n" + "-" * 60 + "\n"
+    "📍 移动止损 @ $%.2f\n"
+    "   当前盈利: %.1fR\n"
+    + "-" * 60
+)
+_CLOSE_LOG = (
+    "\n" + "=" * 60 + "\n"
+    "✅ 平仓: %s\n"
+    "   盈亏: $%.2f | RR: %.1fR\n"
+    + "=" * 60
+)
+
+
+class TradeLog:
+    """
+    已平仓交易记录 (列式环形缓冲区)
+    
+    每个字段一个预分配的 numpy 数组，记录一笔交易只是几次标量写入；
+    超过容量后覆盖最早的记录，长期运行内存不增长。
+    """
+    
+    def __init__(self, cap: int = 100_000):
+        self.cap = cap
+        self.entry = np.empty(cap)
+        self.exit = np.empty(cap)
+        self.pnl = np.empty(cap)
+        self.rr = np.empty(cap)
+        self.ts = np.empty(cap, dtype='datetime64[s]')
+        self.side = np.empty(cap, dtype=np.int8)  # 1 = 多头, -1 = 空头
+        self.n = 0  # 累计记录的交易笔数 (含已被覆盖的)
+    
+    def push(self, entry: float, exit_price: float, pnl: float, rr: float, ts: datetime,
+             side: int = 1):
+        """记录一笔平仓交易 (side: 1 多头 / -1 空头)"""
+        i = self.n % self.cap
+        self.entry[i] = entry
+        self.exit[i] = exit_price
+        self.pnl[i] = pnl
+        self.rr[i] = rr
+        self.ts[i] = np.datetime64(ts, 's')
+        self.side[i] = side
+        self.n += 1
+    
+    def __len__(self) -> int:
+        """缓冲区中保存的交易笔数"""
+        return min(self.n, self.cap)
+    
+    def total_pnl(self) -> float:
+        """缓冲区内交易的盈亏合计"""
+        return float(self.pnl[:len(self)].sum())
+    
+    def to_records(self) -> np.ndarray:
+        """按时间先后 (最早在前) 导出为结构化数组，供事后统计分析"""
+        n = len(self)
+        out = np.empty(n, dtype=_TRADE_DTYPE)
+        # 环形缓冲区写满后，最早的记录从写入位置开始
+        order = np.arange(self.n - n, self.n) % self.cap
+        for name in _TRADE_DTYPE.names:
+            out[name] = getattr(self, name)[order]
+        return out
+
+
+class OrderRecord:
+    """单个订单的跟踪记录 (__slots__，订单状态回调中读写)"""
+    
+    __slots__ = ('trade', 'type', 'submitted', 'filled', 'fill_price', 'closed_time')
+    
+    trade: object
+    type: str
+    submitted: datetime
+    filled: float
+    fill_price: float
+    closed_time: Optional[datetime]
+    
+    def __init__(self, trade, order_type: str, submitted: datetime):
+        self.trade = trade
+        self.type = order_type
+        self.submitted = submitted
+        self.filled = 0.0
+        self.fill_price = 0.0
+        self.closed_time = None
+
+
 class IBKRMonitor:
     """IBKR 连接和事件监控器"""
     
+    __slots__ = ('ib', 'connected', 'reconnect_count', 'max_reconnect', '_last_event_mono',
+                 'event_callbacks', '_on_event', '_open_trades',
+                 'stats_total', 'stats_order_status', 'stats_executions',
+                 'stats_errors', 'stats_reconnects')
+    
     def __init__(self):
         self.ib = None
         self.connected = False
         self.reconnect_count = 0
         self.max_reconnect = 5
-        self.last_event_time = None
+        self._last_event_mono = None  # 最近一次事件的 time.monotonic()，需要时再换算为时间
         self.event_callbacks = []
+        self._on_event = None  # 订单事件转发给 LiveTradingV2
+        self._open_trades = {}  # orderId -> trade，由订单回调维护，终态时移除
         
-        self.stats = {
-            'total_events': 0,
-            'order_status': 0,
-            'executions': 0,
-            'errors': 0,
-            'reconnects': 0
+        # 事件计数用独立的 int 槽位，回调中自增不经过字典查找
+        self.stats_total = 0
+        self.stats_order_status = 0
+        self.stats_executions = 0
+        self.stats_errors = 0
+        self.stats_reconnects = 0
+    
+    @property
+    def stats(self) -> Dict[str, int]:
+        """事件统计快照 (按需组装)"""
+        return {
+            'total_events': self.stats_total,
+            'order_status': self.stats_order_status,
+            'executions': self.stats_executions,
+            'errors': self.stats_errors,
+            'reconnects': self.stats_reconnects
         }
     
     def setup_callbacks(self, ib: IB, on_event: Callable = None):
-        """设置IBKR事件回调"""
+        """
+        设置IBKR事件回调
+        
+        回调为绑定方法而非闭包；重复调用时先解除已注册的回调，事件的处理函数列表不会增长。
+        """
+        if self.ib is not None:
+            self.remove_callbacks()
         self.ib = ib
+        self._on_event = on_event
         
-        def on_connected():
-            self.connected = True
-            self.reconnect_count = 0
-            logger.info("✅ IBKR 已连接")
-            self._log_event("CONNECTED")
-        
-        def on_disconnected():
-            self.connected = False
-            logger.warning("⚠️ IBKR 已断开连接")
-            self._log_event("DISCONNECTED")
-        
-        def on_error(reqId, errorCode, errorString, advanced):
-            self.stats['errors'] += 1
-            logger.error(f"❌ IBKR 错误 [{errorCode}]: {errorString}")
-            self._log_event(f"ERROR:{errorCode}", errorString)
-        
-        def on_order_event(trade):
-            self.stats['order_status'] += 1
-            status = trade.orderStatus.status
-            order_id = trade.order.orderId
-            logger.debug(f"📝 订单更新 #{order_id}: {status}")
-            
-            if on_event:
-                on_event({'type': 'order', 'trade': trade})
-            
-            self._log_event(f"ORDER:{status}", f"Order #{order_id}")
+        ib.connectedEvent += self._on_connected
+        ib.disconnectedEvent += self._on_disconnected
+        ib.errorEvent += self._on_error
+        ib.orderStatusEvent += self._on_order_status
+        ib.execDetailsEvent += self._on_execution
+        ib.commissionReportEvent += self._on_commission_report
         
-        def on_execution(trade, fill):
-            self.stats['executions'] += 1
-            logger.info(f"💰 成交 #{fill.execution.orderId}: {fill.execution.shares} @ {fill.execution.price}")
-            self._log_event("EXECUTION", f"{fill.execution.shares}@{fill.execution.price}")
+        self._log_event("CALLBACKS_SETUP")
+    
+    def remove_callbacks(self):
+        """解除 setup_callbacks 注册的全部回调"""
+        ib = self.ib
+        ib.connectedEvent -= self._on_connected
+        ib.disconnectedEvent -= self._on_disconnected
+        ib.errorEvent -= self._on_error
+        ib.orderStatusEvent -= self._on_order_status
+        ib.execDetailsEvent -= self._on_execution
+        ib.commissionReportEvent -= self._on_commission_report
+    
+    def _on_connected(self):
+        self.connected = True
+        self.reconnect_count = 0
+        logger.info("✅ IBKR 已连接")
+        self._log_event("CONNECTED")
+    
+    def _on_disconnected(self):
+        self.connected = False
+        logger.warning("⚠️ IBKR 已断开连接")
+        self._log_event("DISCONNECTED")
+    
+    def _on_error(self, reqId, errorCode, errorString, advanced):
+        self.stats_errors += 1
+        logger.error("❌ IBKR 错误 [%s]: %s", errorCode, errorString)
+        self._log_event("ERROR:%s %s", errorCode, errorString)
+    
+    def _on_order_status(self, trade):
+        self.stats_order_status += 1
+        status = trade.orderStatus.status
+        order_id = trade.order.orderId
+        logger.debug("📝 订单更新 #%s: %s", order_id, status)
         
-        def on_commissionReport(report):
-            logger.debug(f"💵 佣金: ${report.commission}")
+        if status in _DONE_STATUSES:
+            self._open_trades.pop(order_id, None)
+        else:
+            self._open_trades[order_id] = trade
         
-        ib.connectedEvent += on_connected
-        ib.disconnectedEvent += on_disconnected
-        ib.errorEvent += on_error
-        ib.orderStatusEvent += on_order_event
-        ib.execDetailsEvent += on_execution
-        ib.commissionReportEvent += on_commissionReport
+        if self._on_event:
+            self._on_event({'type': 'order', 'trade': trade})
         
-        self._log_event("CALLBACKS_SETUP")
+        self._log_event("ORDER:%s Order #%s", status, order_id)
+    
+    def _on_execution(self, trade, fill):
+        self.stats_executions += 1
+        logger.info("💰 成交 #%s: %s @ %s", fill.execution.orderId, fill.execution.shares, fill.execution.price)
+        self._log_event("EXECUTION %s@%s", fill.execution.shares, fill.execution.price)
+    
+    def _on_commission_report(self, trade, fill, report):
+        # commissionReportEvent 的参数为 (trade, fill, report)
+        logger.debug("💵 佣金: $%s", report.commission)
+    
+    def _log_event(self, event: str, *args):
+        """记录事件 (event 为 %-格式模板，DEBUG 关闭时不做任何格式化)"""
+        self.stats_total += 1
+        self._last_event_mono = time.monotonic()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📊 IBKR事件: " + event, *args)
     
-    def _log_event(self, event_type: str, details: str = ""):
-        """记录事件"""
-        self.stats['total_events'] += 1
-        self.last_event_time = datetime.now()
-        logger.debug(f"📊 IBKR事件: {event_type} {details}")
+    @property
+    def last_event_time(self) -> Optional[datetime]:
+        """最近一次事件的本地时间 (由单调时钟换算，只在读取时计算)"""
+        if self._last_event_mono is None:
+            return None
+        return datetime.now() - timedelta(seconds=time.monotonic() - self._last_event_mono)
     
     def is_connected(self) -> bool:
         """检查连接状态"""
@@ -105,14 +288,19 @@ class IBKRMonitor:
         return {
             'connected': self.connected,
             'reconnect_count': self.reconnect_count,
-            'stats': self.stats.copy(),
+            'stats': self.stats,
             'last_event': self.last_event_time
         }
     
-    def get_order_status(self, ib: IB) -> Dict:
-        """获取所有订单状态"""
+    def get_order_status(self, ib: IB = None) -> list:
+        """
+        获取未完成订单的状态
+        
+        读取订单回调维护的索引，不再遍历 ib.trades() 的全部历史订单；
+        ib 参数保留以兼容旧的调用方式。
+        """
         orders = []
-        for trade in ib.trades():
+        for trade in self._open_trades.values():
             orders.append({
                 'orderId': trade.order.orderId,
                 'status': trade.orderStatus.status,
@@ -127,50 +315,97 @@ class IBKRMonitor:
 class OrderManager:
     """订单管理器 - 负责订单创建和状态跟踪"""
     
+    __slots__ = ('ib', 'contract', 'monitor', 'active_orders', 'filled_orders',
+                 'cancelled_orders', 'last_fill_time', 'total_filled', '_pending_orders')
+    
     def __init__(self, ib: IB, contract: Future):
         self.ib = ib
         self.contract = contract
         self.monitor = ib
         
-        self.active_orders = {}  # orderId -> trade
-        self.filled_orders = {}  # orderId -> fill info
-        self.cancelled_orders = {}
+        self.active_orders: Dict[int, OrderRecord] = {}
+        # 历史记录按插入顺序保存，长期运行时只保留最近 _ORDER_HISTORY_CAP 条
+        self.filled_orders: Dict[int, OrderRecord] = OrderedDict()
+        self.cancelled_orders: Dict[int, OrderRecord] = OrderedDict()
         
         self.last_fill_time = None
         self.total_filled = 0
+        
+        # 待提交订单 [(订单, 类型)]，flush_orders() 时在同一轮事件循环中一次发出
+        self._pending_orders = []
     
     def create_bracket_order(self, signal: Dict, size: int) -> BracketOrder:
-        """创建括号单"""
+        """
+        创建括号单
+        
+        止盈/止损挂在入场单下 (parentId)，前两条腿 transmit=False，
+        最后提交的止损单 transmit=True，三条腿由网关作为一个整体一次发出。
+        """
         action = signal['action']
+        exit_action = 'SELL' if action == 'BUY' else 'BUY'
         
         parent = LimitOrder(action, size, signal['entry_price'])
-        stop = StopOrder(action, size, signal['stop_loss'])
-        profit = LimitOrder('SELL' if action == 'BUY' else 'BUY', size, signal['take_profit'])
+        profit = LimitOrder(exit_action, size, signal['take_profit'])
+        stop = StopOrder(exit_action, size, signal['stop_loss'])
         
-        return BracketOrder(parent, stop, profit)
+        parent.orderId = self.ib.client.getReqId()
+        profit.orderId = self.ib.client.getReqId()
+        stop.orderId = self.ib.client.getReqId()
+        profit.parentId = stop.parentId = parent.orderId
+        parent.transmit = profit.transmit = False
+        stop.transmit = True
+        
+        return BracketOrder(parent=parent, takeProfit=profit, stopLoss=stop)
+    
+    def queue_order(self, order, order_type: str):
+        """加入待提交队列 (不立即发送)"""
+        self._pending_orders.append((order, order_type))
+    
+    def flush_orders(self) -> list:
+        """
+        一次性提交队列中的全部订单
+        
+        各订单连续调用 placeOrder，中间不让出事件循环，所有腿在同一轮
+        事件循环中发出。
+        
+        Returns:
+            list: 提交得到的 Trade 列表
+        """
+        if not self._pending_orders:
+            return []
+        
+        pending = self._pending_orders
+        self._pending_orders = []
+        
+        now = datetime.now()
+        trades = []
+        for order, order_type in pending:
+            trade = self.ib.placeOrder(self.contract, order)
+            self.active_orders[order.orderId] = OrderRecord(trade, order_type, now)
+            trades.append(trade)
+        return trades
     
     def submit_bracket_order(self, bracket: BracketOrder) -> bool:
-        """提交括号单"""
+        """提交括号单 (三条腿排队后一次发出，transmit=True 的止损单最后提交)"""
         try:
-            for order in [bracket.parent, bracket.stopLoss, bracket.takeProfit]:
-                trade = self.ib.placeOrder(self.contract, order)
-                self.active_orders[order.orderId] = {
-                    'trade': trade,
-                    'action': order.action,
-                    'size': order.totalQuantity,
-                    'submitted': datetime.now(),
-                    'type': 'parent' if order == bracket.parent else ('stop' if order == bracket.stopLoss else 'profit')
-                }
+            self.queue_order(bracket.parent, 'parent')
+            self.queue_order(bracket.takeProfit, 'profit')
+            self.queue_order(bracket.stopLoss, 'stop')
+            self.flush_orders()
             
-            logger.info(f"📤 括号单已提交:")
-            logger.info(f"   入场 #{bracket.parent.orderId}: {bracket.parent.action} {bracket.parent.totalQuantity} @ {bracket.parent.lmtPrice}")
-            logger.info(f"   止损 #{bracket.stopLoss.orderId}: {bracket.stopLoss.action} {bracket.stopLoss.totalQuantity} @ {bracket.stopLoss.auxPrice}")
-            logger.info(f"   止盈 #{bracket.takeProfit.orderId}: {bracket.takeProfit.action} {bracket.takeProfit.totalQuantity} @ {bracket.takeProfit.lmtPrice}")
+            parent, stop, profit = bracket.parent, bracket.stopLoss, bracket.takeProfit
+            logger.info(
+                _BRACKET_LOG,
+                parent.orderId, parent.action, parent.totalQuantity, parent.lmtPrice,
+                stop.orderId, stop.action, stop.totalQuantity, stop.auxPrice,
+                profit.orderId, profit.action, profit.totalQuantity, profit.lmtPrice,
+            )
             
             return True
             
         except Exception as e:
-            logger.error(f"❌ 订单提交失败: {e}")
+            self._pending_orders.clear()
+            logger.error("❌ 订单提交失败: %s", e)
             return False
     
     def update_order_status(self, trade) -> Dict:
@@ -178,37 +413,36 @@ class OrderManager:
         order_id = trade.order.orderId
         status = trade.orderStatus.status
         
-        if order_id not in self.active_orders:
+        record = self.active_orders.get(order_id)
+        if record is None:
             return {'action': 'none', 'status': status}
         
-        entry = self.active_orders[order_id]
-        
         if status == 'Filled':
-            self.filled_orders[order_id] = {
-                **entry,
-                'filled': trade.orderStatus.filled,
-                'fill_price': trade.orderStatus.avgFillPrice,
-                'filled_time': datetime.now()
-            }
+            now = datetime.now()
+            record.filled = trade.orderStatus.filled
+            record.fill_price = trade.orderStatus.avgFillPrice
+            record.closed_time = now
+            self._archive(self.filled_orders, order_id, record)
             del self.active_orders[order_id]
-            self.last_fill_time = datetime.now()
+            self.last_fill_time = now
             self.total_filled += trade.orderStatus.filled
             
-            logger.info(f"✅ 订单成交 #{order_id}: {trade.orderStatus.filled} @ {trade.orderStatus.avgFillPrice}")
+            logger.info("✅ 订单成交 #%s: %s @ %s", order_id, trade.orderStatus.filled, trade.orderStatus.avgFillPrice)
             
             return {
                 'action': 'filled',
                 'order_id': order_id,
                 'size': trade.orderStatus.filled,
                 'price': trade.orderStatus.avgFillPrice,
-                'type': entry['type']
+                'type': record.type
             }
         
         elif status == 'Cancelled':
-            self.cancelled_orders[order_id] = {**entry, 'cancelled_time': datetime.now()}
+            record.closed_time = datetime.now()
+            self._archive(self.cancelled_orders, order_id, record)
             del self.active_orders[order_id]
             
-            logger.info(f"❌ 订单取消 #{order_id}")
+            logger.info("❌ 订单取消 #%s", order_id)
             return {'action': 'cancelled', 'order_id': order_id}
         
         elif status == 'Submitted':
@@ -216,27 +450,40 @@ class OrderManager:
         
         return {'action': 'unknown', 'status': status}
     
+    @staticmethod
+    def _archive(history: OrderedDict, order_id: int, record: OrderRecord):
+        """写入历史记录，超过上限时丢弃最早的一条"""
+        history[order_id] = record
+        if len(history) > _ORDER_HISTORY_CAP:
+            history.popitem(last=False)
+    
     def get_active_count(self) -> int:
         """获取活跃订单数量"""
         return len(self.active_orders)
     
-    def cancel_all(self):
-        """取消所有活跃订单"""
-        cancelled = []
-        for order_id in list(self.active_orders.keys()):
+    def cancel_all(self, keep: Tuple[str, ...] = ()):
+        """
+        取消所有活跃订单 (单次遍历，取消失败的订单保留为活跃)
+        
+        Args:
+            keep: 不取消的订单类型 ('parent'/'profit'/'stop')，保留为活跃
+        """
+        cancelled = 0
+        remaining = {}
+        for order_id, record in self.active_orders.items():
+            if record.type in keep:
+                remaining[order_id] = record
+                continue
             try:
-                trade = self.active_orders[order_id]['trade']
-                self.ib.cancelOrder(trade.order)
-                cancelled.append(order_id)
+                self.ib.cancelOrder(record.trade.order)
+                cancelled += 1
             except Exception as e:
-                logger.error(f"取消订单 {order_id} 失败: {e}")
-        
-        for oid in cancelled:
-            if oid in self.active_orders:
-                del self.active_orders[oid]
+                logger.error("取消订单 %s 失败: %s", order_id, e)
+                remaining[order_id] = record
+        self.active_orders = remaining
         
-        logger.info(f"✅ 已取消 {len(cancelled)} 个订单")
-        return len(cancelled)
+        logger.info("✅ 已取消 %d 个订单", cancelled)
+        return cancelled
     
     def get_summary(self) -> Dict:
         """获取订单摘要"""
@@ -251,6 +498,12 @@ class OrderManager:
 class LiveTradingV2:
     """IBKR 实盘交易 V2.1"""
     
+    __slots__ = ('capital', 'strategy', 'risk', 'data_manager', 'running', 'ib', 'contract',
+                 'order_manager', 'monitor', 'daily_pnl', 'trade_log', '_events', '_last_day',
+                 '_session_log_bucket', '_risk_log_bucket', '_reconnect_task', '_closing',
+                 '_mtf_hl', '_mtf_versions', '_mtf_key', '_mtf_revision', '_mtf_ready',
+                 '_can_trade')
+    
     def __init__(self, initial_capital=100000):
         self.capital = initial_capital
         self.strategy = ICTSMCV2Strategy()
@@ -262,15 +515,37 @@ class LiveTradingV2:
         self.order_manager = None
         self.monitor = None
         self.daily_pnl = 0.0
-        self.trade_history = []
+        self.trade_log = TradeLog()
+        self._events = None  # 事件队列: K线推送/订单成交回调写入，主循环消费
+        self._last_day = None  # 上次处理K线的日期序号 (date.toordinal)
+        # 限频日志的时间桶 (time.monotonic 按间隔取整)
+        self._session_log_bucket = -1
+        self._risk_log_bucket = -1
+        self._reconnect_task = None
+        self._closing = False  # 主动断开时不触发重连
+        # 传给策略的各时间框架 (最高价, 最低价) 数组: 只替换版本号变化的时间框架
+        # 按 _TF_* 下标存放，避免按字符串键查字典
+        self._mtf_hl = [(_EMPTY_PRICES, _EMPTY_PRICES)] * len(_MTF_FRAMES)
+        self._mtf_versions = [-1] * len(_MTF_FRAMES)
+        self._mtf_key = None  # (15分钟, 1小时, 4小时) 版本号，策略据此复用分析结果
+        self._mtf_revision = -1  # 上次刷新时 DataManager 的总版本号
+        self._mtf_ready = False  # 15分钟K线是否足够 (>= 20 根)
+        # 风控判断只依赖资金和日盈亏，两者变化时才重新计算
+        self._can_trade = self.risk.should_trade(self.capital, self.daily_pnl)
     
-    def connect_ibkr(self) -> bool:
-        """连接 IBKR Gateway"""
-        logger.info(f"正在连接 IBKR Gateway: {Config.IBKR_HOST}:{Config.IBKR_PORT}...")
+    def _book_pnl(self, pnl: float):
+        """记入已实现盈亏并刷新风控判断"""
+        self.daily_pnl += pnl
+        self.capital += pnl
+        self._can_trade = self.risk.should_trade(self.capital, self.daily_pnl)
+    
+    async def connect_ibkr(self) -> bool:
+        """连接 IBKR Gateway (在当前事件循环中异步完成，不需要可重入的事件循环)"""
+        logger.info("正在连接 IBKR Gateway: %s:%s...", Config.IBKR_HOST, Config.IBKR_PORT)
         
         try:
             self.ib = IB()
-            self.ib.connect(
+            await self.ib.connectAsync(
                 host=Config.IBKR_HOST,
                 port=Config.IBKR_PORT,
                 clientId=Config.IBKR_CLIENT_ID,
@@ -286,9 +561,17 @@ class LiveTradingV2:
                 currency=Config.CURRENCY,
                 lastTradeDateOrContractMonth=Config.CONTRACT_MONTH
             )
+            # 启动时解析一次合约 (填入 conId)，之后下单/数据请求都使用同一个已解析对象
+            if await self.ib.qualifyContractsAsync(self.contract) and self.contract.conId:
+                logger.info("✅ 合约已解析: conId=%s", self.contract.conId)
+            else:
+                logger.warning("⚠️ 合约解析失败，按合约字段继续")
             
             self.order_manager = OrderManager(self.ib, self.contract)
             
+            # 断线立即触发重连，不等心跳
+            self.ib.disconnectedEvent += self._schedule_reconnect
+            
             logger.info("✅ IBKR Gateway 连接成功!")
             return True
             
@@ -297,7 +580,7 @@ class LiveTradingV2:
             logger.error("=" * 60)
             logger.error("❌ IBKR Gateway 连接失败!")
             logger.error("=" * 60)
-            logger.error(f"错误信息: {e}")
+            logger.error("错误信息: %s", e)
             logger.error("=" * 60)
             return False
     
@@ -305,197 +588,296 @@ class LiveTradingV2:
         """IBKR 事件回调"""
         if event['type'] == 'order':
             trade = event['trade']
-            self.order_manager.update_order_status(trade)
+            result = self.order_manager.update_order_status(trade)
+            if result['action'] == 'filled':
+                # 成交立即唤醒主循环，不等下一根K线
+                self._post_event('fill')
+    
+    def _post_event(self, kind: str):
+        """IB 回调 -> 主循环: 只投递事件类型，策略计算在主循环中进行"""
+        if self._events is not None:
+            self._events.put_nowait(kind)
+    
+    def _on_bar_closed(self):
+        """K线推送回调: 一根1分钟K线收盘"""
+        self._post_event('bar')
+    
+    def request_stop(self, signum=None):
+        """停止信号回调: 结束主循环 (投递事件唤醒等待中的主循环，不等 60 秒超时)"""
+        logger.info("收到停止信号 %s", signum)
+        self.running = False
+        self._post_event('stop')
+    
+    def _schedule_reconnect(self):
+        """disconnectedEvent 回调: 启动后台重连 (已在重连时忽略)"""
+        if self._closing or not self.running:
+            return
+        if self._reconnect_task is not None and not self._reconnect_task.done():
+            return
+        self._reconnect_task = asyncio.ensure_future(self._reconnect_with_backoff())
+    
+    async def _reconnect_with_backoff(self):
+        """指数退避重连 (0.1 秒起每次翻倍，上限 30 秒，带随机抖动)，成功后重新订阅K线"""
+        attempt = 0
+        while self.running and not self._closing and not self.ib.isConnected():
+            # 抖动 0.5~1.5 倍，多个客户端不会同时重连
+            delay = min(_RECONNECT_MAX_DELAY, _RECONNECT_BASE_DELAY * 2 ** attempt) * (0.5 + random.random())
+            await asyncio.sleep(delay)
+            attempt += 1
+            self.monitor.reconnect_count += 1
+            self.monitor.stats_reconnects += 1
+            try:
+                await self.ib.connectAsync(
+                    host=Config.IBKR_HOST,
+                    port=Config.IBKR_PORT,
+                    clientId=Config.IBKR_CLIENT_ID,
+                    timeout=30
+                )
+            except Exception as e:
+                logger.warning("⚠️ 第 %d 次重连失败: %s", attempt, e)
+                continue
+            
+            # 断线后原订阅失效，重新订阅
+            self.data_manager.unsubscribe()
+            await self.data_manager.subscribe_async(self._on_bar_closed)
+            logger.info("✅ 重连成功")
     
-    def disconnect_ibkr(self):
-        """断开 IBKR 连接"""
+    def disconnect_ibkr(self, keep_exits: bool = False):
+        """
+        断开 IBKR 连接
+        
+        Args:
+            keep_exits: 保留括号单的止损/止盈腿 (程序错误退出时持仓仍受止损保护；
+                两条腿同属一个 OCA 组，一并保留)
+        """
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        
         if self.order_manager:
-            self.order_manager.cancel_all()
+            self.order_manager.cancel_all(keep=('stop', 'profit') if keep_exits else ())
+        
+        self.data_manager.unsubscribe()
         
         if self.ib and self.ib.isConnected():
             self.ib.disconnect()
             logger.info("已断开 IBKR Gateway 连接")
     
-    def initialize(self):
+    async def initialize(self):
         """初始化"""
-        self.data_manager.initialize(self.ib, self.contract)
+        # 本地数据加载与K线订阅并行；订阅后主循环的 update() 只合并新收盘的K线。
+        # 同时在线程中预编译策略内核，第一根K线到来时不再等待 JIT 编译
+        await asyncio.gather(
+            self.data_manager.initialize_async(self.ib, self.contract, self._on_bar_closed),
+            asyncio.to_thread(warmup),
+        )
         
         logger.info("")
         logger.info("=" * 60)
         logger.info("🚀 V2.1 实盘交易系统启动")
         logger.info("=" * 60)
-        logger.info(f"初始资金: ${self.capital:,.2f}")
-        logger.info(f"合约: {Config.SYMBOL} ({Config.EXCHANGE})")
-        logger.info(f"交易时段: 07:00-20:00 CST")
+        logger.info("初始资金: $%s", format(self.capital, ",.2f"))
+        logger.info("合约: %s (%s)", Config.SYMBOL, Config.EXCHANGE)
+        logger.info("交易时段: 07:00-20:00 CST")
         logger.info("=" * 60)
         
         bar_counts = self.data_manager.get_bar_count()
         logger.info("📊 数据状态:")
         for tf, count in bar_counts.items():
-            logger.info(f"   {tf}: {count} 根K线")
+            logger.info("   %s: %s 根K线", tf, count)
         
         status = self.monitor.get_status()
-        logger.info(f"📡 IBKR 监控: {'已连接' if status['connected'] else '未连接'}")
+        logger.info("📡 IBKR 监控: %s", '已连接' if status['connected'] else '未连接')
     
     async def run(self):
-        """主循环"""
-        if not self.connect_ibkr():
+        """主循环: K线收盘或订单成交事件触发策略计算，连接/状态检查由心跳协程负责"""
+        if not await self.connect_ibkr():
             return False
         
-        self.initialize()
+        self._events = asyncio.Queue()
+        await self.initialize()
         self.running = True
         
-        last_date = None
-        last_minute = None
-        last_status_log = 0
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            while self.running:
+                # 等待事件; 订阅失效时最多 60 秒后按轮询方式执行一次
+                try:
+                    await asyncio.wait_for(self._events.get(), timeout=60)
+                except asyncio.TimeoutError:
+                    pass
+                # 积压的事件合并为一次计算
+                while not self._events.empty():
+                    self._events.get_nowait()
+                if not self.running:
+                    break
+                
+                try:
+                    await self._on_new_bar(datetime.now())
+                except (ConnectionError, asyncio.TimeoutError) as e:
+                    # 网络/网关问题: 立即走退避重连，不等心跳
+                    logger.warning("⚠️ 连接异常: %s", e)
+                    self._schedule_reconnect()
+                except Exception:
+                    # 其他异常是程序错误: 记录完整堆栈后停止，不带着错误状态继续交易。
+                    # 已成交持仓的止损单留在 IBKR 端继续生效
+                    logger.exception("交易错误")
+                    self.running = False
+                    self.disconnect_ibkr(keep_exits=True)
+                    raise
+        finally:
+            heartbeat.cancel()
         
+        self.disconnect_ibkr()
+        return True
+    
+    async def _heartbeat(self):
+        """心跳: 每分钟整点检查连接、输出非交易时段与状态日志"""
         while self.running:
+            now = datetime.now()
             try:
-                now = datetime.now()
-                today = now.date()
-                current_minute = now.minute
-                
-                if last_date != today:
-                    last_date = today
-                    self.daily_pnl = 0.0
-                    self.strategy.reset()
-                    logger.info(f"\n📅 {now.strftime('%Y-%m-%d')} - 新交易日")
-                
                 if not self.monitor or not self.monitor.is_connected():
-                    logger.warning("⚠️ IBKR 未连接，尝试重连...")
-                    if self.ib and not self.ib.isConnected():
-                        try:
-                            self.ib.reconnect()
-                            self.monitor.setup_callbacks(self.ib, self.on_ibkr_event)
-                            logger.info("✅ 重连成功")
-                        except:
-                            await asyncio.sleep(10)
-                            continue
-                    await asyncio.sleep(30)
-                    continue
-                
-                session = self.strategy.is_trading_session(now)
-                
-                if not session:
-                    if current_minute % 30 == 0:
-                        logger.debug(f"非交易时段: {now.strftime('%H:%M')}")
-                    await asyncio.sleep(30)
-                    continue
-                
-                if current_minute != last_minute:
-                    updated = self.data_manager.update()
-                    if updated:
-                        logger.debug("📊 数据已更新")
-                    last_minute = current_minute
+                    # 重连由 disconnectedEvent 触发，这里只补一次调度 (防止事件丢失)
+                    logger.warning("⚠️ IBKR 未连接，等待重连...")
+                    self._schedule_reconnect()
                 
-                mtf_data = {
-                    '4hr': self.data_manager.get_data('4hr'),
-                    '1hr': self.data_manager.get_data('1hr'),
-                    '15min': self.data_manager.get_data('15min'),
-                    '5min': self.data_manager.get_data('5min'),
-                }
+                elif not self.strategy.is_trading_session(now):
+                    # 每 30 分钟最多记录一次
+                    bucket = int(time.monotonic()) // 1800
+                    if bucket != self._session_log_bucket:
+                        self._session_log_bucket = bucket
+                        logger.debug("非交易时段: %02d:%02d", now.hour, now.minute)
                 
-                if mtf_data['15min'].empty or len(mtf_data['15min']) < 20:
-                    await asyncio.sleep(30)
-                    continue
-                
-                current_price = self.data_manager.get_current_price()
-                
-                if current_price <= 0:
-                    await asyncio.sleep(30)
-                    continue
-                
-                if not self.risk.should_trade(self.capital, self.daily_pnl):
-                    if current_minute % 10 == 0:
-                        logger.warning("风险管理阻止交易")
-                    await asyncio.sleep(30)
-                    continue
-                
-                status = self.strategy.get_status()
+                elif logger.isEnabledFor(logging.DEBUG):
+                    # 只需连接标志，不复制完整的监控统计；DEBUG 关闭时不生成订单摘要
+                    order_summary = self.order_manager.get_summary()
+                    logger.debug("📊 状态: 订单=%s | IBKR=%s", order_summary, self.monitor.connected)
                 
-                if status['status'] == 'idle':
-                    if self.order_manager.get_active_count() > 0:
-                        await asyncio.sleep(30)
-                        continue
-                    
-                    signal = self.strategy.generate_signal(mtf_data, current_price, now)
-                    
-                    if signal:
-                        size = self.risk.calculate_position_size(
-                            self.capital,
-                            signal['entry_price'],
-                            signal['stop_loss']
-                        )
-                        
-                        if size > 0:
-                            self.strategy.open_position(signal, size)
-                            
-                            logger.info("")
-                            logger.info("=" * 60)
-                            logger.info(f"📢 开仓信号: {signal['action']}")
-                            logger.info(f"   手数: {size} | 入场: ${signal['entry_price']:.2f}")
-                            logger.info(f"   止损: ${signal['stop_loss']:.2f} | 止盈: ${signal['take_profit']:.2f}")
-                            logger.info(f"   置信度: {signal['confidence']:.0%}")
-                            logger.info("=" * 60)
-                            
-                            bracket = self.order_manager.create_bracket_order(signal, size)
-                            if self.order_manager.submit_bracket_order(bracket):
-                                logger.info("⏳ 等待订单执行...")
+            except Exception as e:
+                logger.error("心跳错误: %s", e)
+            
+            # 对齐到下一个整分钟，心跳与K线收盘同节奏，不随运行时间漂移
+            # (本轮检查耗时远小于1秒，直接沿用本轮开始时的时间)
+            await asyncio.sleep(60 - now.second - now.microsecond / 1e6)
+    
+    def _refresh_mtf_data(self) -> list:
+        """按 DataManager 版本号只重新取出变化的时间框架的价格数组，返回同一个列表 (按 _TF_* 下标)"""
+        mtf_hl = self._mtf_hl
+        revision = self.data_manager.revision
+        if revision == self._mtf_revision:
+            return mtf_hl
+        self._mtf_revision = revision
+        
+        versions = self.data_manager.version
+        seen = self._mtf_versions
+        for i, tf in enumerate(_MTF_FRAMES):
+            v = versions[tf]
+            if seen[i] != v:
+                seen[i] = v
+                df = self.data_manager.get_data(tf)
+                if len(df):
+                    mtf_hl[i] = (as_price_array(df['high']), as_price_array(df['low']))
+                else:
+                    mtf_hl[i] = (_EMPTY_PRICES, _EMPTY_PRICES)
+        self._mtf_key = (seen[_TF_15M], seen[_TF_1H], seen[_TF_4H])
+        self._mtf_ready = len(mtf_hl[_TF_15M][0]) >= 20
+        return mtf_hl
+    
+    async def _on_new_bar(self, now: datetime):
+        """新K线收盘: 合并数据并运行策略"""
+        day = now.toordinal()
+        if self._last_day != day:
+            self._last_day = day
+            self.daily_pnl = 0.0
+            self._can_trade = self.risk.should_trade(self.capital, self.daily_pnl)
+            self.strategy.reset()
+            logger.info("\n📅 %s - 新交易日", now.date())
+        
+        # 连接状态由事件回调维护，这里只读标志
+        if not self.monitor or not self.monitor.connected:
+            return
+        
+        if not self.strategy.is_trading_session(now):
+            return
+        
+        changed = await self.data_manager.update_async()
+        if changed:
+            logger.debug("📊 数据已更新: %s", sorted(changed))
+        
+        mtf_hl = self._refresh_mtf_data()
+        if not self._mtf_ready:
+            return
+        h15, l15 = mtf_hl[_TF_15M]
+        
+        current_price = self.data_manager.get_current_price()
+        
+        if current_price <= 0:
+            return
+        
+        if not self._can_trade:
+            # 每 10 分钟最多记录一次
+            bucket = int(time.monotonic()) // 600
+            if bucket != self._risk_log_bucket:
+                self._risk_log_bucket = bucket
+                logger.warning("风险管理阻止交易")
+            return
+        
+        # 直接读取持仓对象，不经 get_status() 每根K线复制一份字典
+        trade = self.strategy.active_trade
+        
+        if trade is None:
+            if self.order_manager.get_active_count() > 0:
+                return
+            
+            h1, l1 = mtf_hl[_TF_1H]
+            h4, l4 = mtf_hl[_TF_4H]
+            signal = self.strategy.generate_signal_fast(h15, l15, current_price, now,
+                                                        h1, l1, h4, l4, key=self._mtf_key)
+            
+            if signal:
+                size = self.risk.calculate_position_size(
+                    self.capital,
+                    signal['entry_price'],
+                    signal['stop_loss']
+                )
                 
-                elif status['status'] == 'active':
-                    result = self.strategy.update_trade(current_price, now)
+                if size > 0:
+                    self.strategy.open_position(signal, size, now)
                     
-                    if result['action'] == 'partial_close':
-                        logger.info("")
-                        logger.info("-" * 60)
-                        logger.info(f"✂️ 半仓平仓 @ ${result['price']:.2f}")
-                        logger.info(f"   盈利: ${result['pnl']:.2f} | RR: {result['rr']:.1f}R")
-                        logger.info("-" * 60)
-                        self.daily_pnl += result['pnl']
-                        self.capital += result['pnl']
+                    logger.info(
+                        _OPEN_SIGNAL_LOG,
+                        signal['action'], size, signal['entry_price'],
+                        signal['stop_loss'], signal['take_profit'],
+                        signal['confidence'] * 100,
+                    )
                     
-                    elif result['action'] == 'trail_stop':
-                        if result['rr'] >= 2:
-                            logger.info("")
-                            logger.info("-" * 60)
-                            logger.info(f"📍 移动止损 @ ${result['new_stop_loss']:.2f}")
-                            logger.info(f"   当前盈利: {result['rr']:.1f}R")
-                            logger.info("-" * 60)
-                    
-                    elif result['action'] == 'close':
-                        logger.info("")
-                        logger.info("=" * 60)
-                        logger.info(f"✅ 平仓: {result['reason']}")
-                        logger.info(f"   盈亏: ${result['pnl']:.2f} | RR: {result.get('rr', 0):.1f}R")
-                        logger.info("=" * 60)
-                        
-                        self.daily_pnl += result['pnl']
-                        self.capital += result['pnl']
-                        
-                        self.trade_history.append({
-                            'entry_price': status['trade']['entry_price'],
-                            'exit_price': current_price,
-                            'pnl': result['pnl'],
-                            'rr': result.get('rr', 0),
-                            'time': now
-                        })
-                        
-                        self.order_manager.cancel_all()
+                    bracket = self.order_manager.create_bracket_order(signal, size)
+                    if self.order_manager.submit_bracket_order(bracket):
+                        logger.info("⏳ 等待订单执行...")
+        
+        else:
+            # 平仓后 active_trade 会被清空，trade 保留引用
+            result = self.strategy.update_trade(current_price, now)
+            
+            if result['action'] == 'partial_close':
+                logger.info(_PARTIAL_CLOSE_LOG, result['price'], result['pnl'], result['rr'])
+                self._book_pnl(result['pnl'])
+            
+            elif result['action'] == 'trail_stop':
+                if result['rr'] >= 2:
+                    logger.info(_TRAIL_STOP_LOG, result['new_stop_loss'], result['rr'])
+            
+            elif result['action'] == 'close':
+                logger.info(_CLOSE_LOG, result['reason'], result['pnl'], result.get('rr', 0))
                 
-                if now.timestamp() - last_status_log > 60:
-                    last_status_log = now.timestamp()
-                    order_summary = self.order_manager.get_summary()
-                    monitor_status = self.monitor.get_status()
-                    logger.debug(f"📊 状态: 订单={order_summary} | IBKR={monitor_status['connected']}")
+                self._book_pnl(result['pnl'])
                 
-                await asyncio.sleep(30)
+                # 交易记录按整笔交易盈亏 (含已部分平仓的仓位)，当日盈亏已分两次记入
+                self.trade_log.push(trade.entry_price, current_price,
+                                    trade.pnl, result.get('rr', 0), now,
+                                    1 if trade.action == 'BUY' else -1)
                 
-            except Exception as e:
-                logger.error(f"交易错误: {e}")
-                await asyncio.sleep(30)
-        
-        self.disconnect_ibkr()
-        return True
+                self.order_manager.cancel_all()
     
     def get_status(self) -> dict:
         if self.order_manager:
@@ -506,20 +888,25 @@ class LiveTradingV2:
         return {
             'capital': self.capital,
             'daily_pnl': self.daily_pnl,
-            'total_trades': len(self.trade_history),
+            'total_trades': self.trade_log.n,
             'orders': order_summary
         }
 
 
-def signal_handler(signum, frame):
-    logger.info("收到停止信号")
+def _install_signal_handlers(trading: 'LiveTradingV2'):
+    """SIGINT/SIGTERM 直接结束交易主循环"""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, trading.request_stop, sig)
+        except NotImplementedError:
+            # Windows 事件循环不支持 add_signal_handler
+            signal.signal(sig, lambda signum, frame: loop.call_soon_threadsafe(trading.request_stop, signum))
 
 
 async def main():
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    
     trading = LiveTradingV2(initial_capital=100000)
+    _install_signal_handlers(trading)
     
     try:
         success = await trading.run()
@@ -531,18 +918,22 @@ async def main():
     finally:
         if trading.running:
             trading.disconnect_ibkr()
-            
+        
+        if trading.order_manager is not None:
             status = trading.get_status()
             logger.info("")
             logger.info("=" * 60)
             logger.info("📊 交易摘要")
             logger.info("=" * 60)
-            logger.info(f"💰 最终资金: ${status['capital']:,.2f}")
-            logger.info(f"📈 日盈亏: ${status['daily_pnl']:,.2f}")
-            logger.info(f"🎯 总交易: {status['total_trades']} 笔")
-            logger.info(f"📤 活跃订单: {status['orders']['active']}")
+            logger.info("💰 最终资金: $%s", format(status['capital'], ",.2f"))
+            logger.info("📈 日盈亏: $%s", format(status['daily_pnl'], ",.2f"))
+            logger.info("🎯 总交易: %s 笔", status['total_trades'])
+            logger.info("📤 活跃订单: %s", status['orders']['active'])
             logger.info("=" * 60)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())